@@ -0,0 +1,455 @@
+"""
+---------------------------------------------
+Project: Snake Game
+File Name: autopilot.py
+Created by: OverworldLord
+---------------------------------------------
+This program implements the 'Snake' game,
+       as described in README.md.
+---------------------------------------------
+PYLINT NOTES
+Code style checked with pylint, using the
+following:
+
+    pylint autopilot.py -d no-member
+---------------------------------------------
+This file lets the game play itself, for soak
+tests and to keep the renderer busy. Like
+engine.py nothing in here needs pygame.
+Classes are as follows:
+Autopilot - Steers the snake to the food
+            with A*, around its own body and
+            where the demons are heading. It
+            stands in for
+            PlayerInput.get_movement, or is
+            used as a policy for play().
+
+Planning works on cells. The body is not a
+wall, each segment blocks its cell only until
+the tail has passed it, so a route can follow
+the tail through gaps that open as it moves.
+The route is kept between ticks and only the
+next few steps are rechecked, a blocked step
+is patched with a short detour back onto the
+route. A full search only happens when food is
+eaten or the detour fails, and is cut short
+when it looks at too many cells or, when
+steering for a player, runs over its time
+budget, heading for the closest cell it found
+until the next search. Headless games have no
+time budget, so a seed always plays the same.
+
+Run this file to watch how long it takes to
+decide, over a game played headless:
+
+    python autopilot.py --board 40 40 --seed 1
+---------------------------------------------
+"""
+
+#Used to keep the route and search the board
+from collections import deque
+from itertools import islice
+import heapq
+
+#Used to remember when the snake entered each cell
+from array import array
+
+#Used to keep to the time budget and read the command line
+import time
+import argparse
+
+#Imports the simulation core
+from engine import INPUT
+from engine import GameState
+from engine import Board
+from engine import OccupancyGrid
+from engine import play
+from engine import CELL_SIZE
+from engine import LOWER_BOUND
+from engine import IMPOSSIBLE_MODE
+from engine import DEMONS_TO_SPAWN
+
+#Longest the autopilot may spend deciding each tick in ms when steering for a player, a
+#tenth of the fastest tick
+AUTOPILOT_BUDGET = LOWER_BOUND/10
+
+#Most cells a full search and a detour look at, so a decision takes the same path every
+#time a seed is played. The time budget is only a backstop for slow machines, and isn't
+#used when playing headless, where it would make results depend on the machine.
+SEARCH_NODES = 1500
+DETOUR_NODES = 200
+
+#How many steps of the route are rechecked each tick, and how many steps past a blocked
+#one a detour can rejoin it
+REPAIR_HORIZON = 8
+
+#How many demon moves ahead their paths are predicted, and how many cells either side of
+#each predicted position are avoided. Demons are only avoided for that many ticks.
+DEMON_HORIZON = 6
+DEMON_MARGIN = 1
+
+#Most demons whose paths are predicted, the ones nearest the head
+DEMONS_PREDICTED = 16
+
+#Most cells counted when checking there's room to move into, so long snakes stay quick
+SPACE_LIMIT = 1000
+
+#How many recent decision times are kept for measurement
+DECISION_SAMPLES = 256
+
+class Autopilot():
+    """ Steers the snake to the food by itself, one decision per tick """
+    def __init__(self, state=None, budget=AUTOPILOT_BUDGET):
+        """ Class Constructor, state is the game to steer. It can instead be given on the
+            first call, when used as a policy for play(). budget is the most time in ms
+            to spend deciding each tick, or None to only limit the cells looked at """
+        self.state = None
+        self.occupancy = None
+        self.budget = budget
+        #The route ahead as cell indices, and the food cell it ends at (-1 if the search
+        #was cut short before it got there)
+        self.path = deque()
+        self.target = -1
+        #How many heads had been pushed when the snake last entered each cell, the
+        #number pushed so far, and the tick they were counted up to
+        self.entered = array('l')
+        self.pushes = 0
+        self.synced_ticks = -1
+        #Cells the demons are predicted to pass through, and the demons near the head
+        self.danger = set()
+        self.nearby = []
+        #Recent decision times in ms, the slowest of all, and how often the route was
+        #planned and patched
+        self.decision_times = deque(maxlen=DECISION_SAMPLES)
+        self.slowest = 0
+        self.replans = 0
+        self.repairs = 0
+        if state is not None:
+            self.attach(state)
+    def __call__(self, state):
+        """ Returns the direction for this tick, so the autopilot can be used with play() """
+        if state is not self.state:
+            self.attach(state)
+        return self.get_movement(state.direction)
+    def attach(self, state):
+        """ Starts steering the given game """
+        self.state = state
+        self.occupancy = state.snake.occupancy
+        self.entered = array('l', bytes(array('l').itemsize*len(self.occupancy.cells)))
+        self.resync()
+    def resync(self):
+        """ Works out when each segment entered its cell from the whole snake """
+        snake = self.state.snake
+        for segment, pos in enumerate(snake):
+            cell = self.occupancy.index(pos)
+            if cell >= 0:
+                self.entered[cell] = len(snake) - 1 - segment
+        self.pushes = len(snake)
+        self.synced_ticks = self.state.ticks
+        self.path.clear()
+        self.target = -1
+    def sync(self):
+        """ Catches up with the snake's last move, one new head per tick """
+        if self.state.ticks == self.synced_ticks:
+            return
+        if self.state.ticks != self.synced_ticks + 1:
+            self.resync()
+            return
+        head = self.occupancy.index(self.state.snake.head())
+        if head >= 0:
+            self.entered[head] = self.pushes
+        self.pushes += 1
+        self.synced_ticks = self.state.ticks
+        #Step along the route, unless something else steered the snake off it
+        if self.path and self.path[0] == head:
+            self.path.popleft()
+        else:
+            self.path.clear()
+    def get_movement(self, direction=INPUT.NONE):
+        """ Returns the direction for a snake heading in direction to take this tick """
+        start = time.perf_counter()
+        move = self.decide(direction, start + self.budget/1000 if self.budget is not None
+                           else None)
+        elapsed = (time.perf_counter() - start)*1000
+        self.decision_times.append(elapsed)
+        self.slowest = max(self.slowest, elapsed)
+        return move
+    def decision_time(self):
+        """ Returns the mean and worst time in ms taken to decide, over the recent ticks """
+        if not self.decision_times:
+            return 0, 0
+        return sum(self.decision_times)/len(self.decision_times), max(self.decision_times)
+    def decide(self, direction, deadline):
+        """ Keeps the route up to date and returns the first step of it, or the roomiest
+            way to go if there's no safe route """
+        self.sync()
+        head = self.occupancy.index(self.state.snake.head())
+        if head < 0:
+            return direction
+        self.predict_demons()
+
+        blocked = self.blocked_step()
+        if blocked is not None and not self.repair(head, blocked, deadline):
+            self.replan(head, deadline)
+        if self.path and self.space(self.path[0], False) >= self.space_needed():
+            return self.direction_to(head, self.path[0])
+
+        #Following the route would box the snake in, find it again next tick
+        self.path.clear()
+        return self.survive(head, direction)
+    def free_after(self):
+        """ Returns what to add to a cell's entry count to get the tick its segment
+            leaves. The tail leaves next tick, once any fat has been burned """
+        return self.state.ruleset.fat + 1 - (self.pushes - len(self.state.snake))
+    def passable(self, cell, tick, free_after, danger=True):
+        """ Whether the snake can be in cell after the given number of ticks, keeping
+            away from the demons unless danger is False """
+        return ((not self.occupancy.cells[cell] & OccupancyGrid.SNAKE or
+                 self.entered[cell] + free_after <= tick) and
+                (not danger or tick > DEMON_HORIZON or cell not in self.danger))
+    def neighbours(self, cell):
+        """ Returns the cells next to cell on the board """
+        columns = self.occupancy.columns
+        found = []
+        if cell % columns:
+            found.append(cell - 1)
+        if cell % columns < columns - 1:
+            found.append(cell + 1)
+        if cell >= columns:
+            found.append(cell - columns)
+        if cell < len(self.occupancy.cells) - columns:
+            found.append(cell + columns)
+        return found
+    def neck(self):
+        """ Returns the cell behind the head, which the snake can't turn back into """
+        snake = self.state.snake
+        return self.occupancy.index(snake[1]) if len(snake) > 1 else -1
+    def direction_to(self, cell, next_cell):
+        """ Returns the direction that moves from cell to the neighbouring next_cell """
+        if next_cell == cell - 1:
+            return INPUT.LEFT
+        if next_cell == cell + 1:
+            return INPUT.RIGHT
+        if next_cell < cell:
+            return INPUT.UP
+        return INPUT.DOWN
+    def predict_demons(self):
+        """ Marks the cells around where each nearby demon is heading as dangerous, moving
+            them the way set_demon_position does by the average step """
+        self.danger = set()
+        self.nearby = []
+        snake = self.state.snake
+        entities = self.state.entities
+        if not entities.demon_active(snake):
+            return
+        head_x, head_y = snake.head()
+        step = (2 + int(len(snake)/12) - 1)/2
+        reach = DEMON_HORIZON*(step*2 + 2*IMPOSSIBLE_MODE) + CELL_SIZE*(DEMON_MARGIN + 1)
+        self.nearby = entities.get_demon_position().within(head_x - reach, head_y - reach,
+                                                           head_x + reach, head_y + reach)
+        if len(self.nearby) > DEMONS_PREDICTED:
+            self.nearby = heapq.nsmallest(DEMONS_PREDICTED, self.nearby, key=lambda demon: max(
+                abs(demon[0] - head_x), abs(demon[1] - head_y)))
+        for demon_x, demon_y in self.nearby:
+            for _ in range(0, DEMON_HORIZON + 1):
+                self.mark_danger(demon_x, demon_y)
+                if abs(demon_x - head_x) > abs(demon_y - head_y):
+                    move_x, move_y = step/2, step + 2*IMPOSSIBLE_MODE
+                else:
+                    move_x, move_y = step + 2*IMPOSSIBLE_MODE, step/2
+                demon_x += move_x if head_x + CELL_SIZE/2 > demon_x else -move_x
+                demon_y += move_y if head_y + CELL_SIZE/2 > demon_y else -move_y
+    def mark_danger(self, demon_x, demon_y):
+        """ Marks the cells within DEMON_MARGIN of a demon's position as dangerous """
+        for cell_x in range(-DEMON_MARGIN, DEMON_MARGIN + 1):
+            for cell_y in range(-DEMON_MARGIN, DEMON_MARGIN + 1):
+                cell = self.occupancy.index((demon_x + cell_x*CELL_SIZE,
+                                             demon_y + cell_y*CELL_SIZE))
+                if cell >= 0:
+                    self.danger.add(cell)
+    def blocked_step(self):
+        """ Returns the first step of the route that's blocked, 0 if there's no route to
+            follow, or None if the next REPAIR_HORIZON steps are clear """
+        if not self.path or (self.target >= 0 and
+                             not self.occupancy.cells[self.target] & OccupancyGrid.FOOD):
+            self.path.clear()
+            return 0
+        free_after = self.free_after()
+        for step, cell in enumerate(islice(self.path, 0, REPAIR_HORIZON)):
+            if not self.passable(cell, step + 1, free_after):
+                return step
+        return None
+    def replan(self, head, deadline):
+        """ Searches for a new route from head to the nearest food """
+        self.replans += 1
+        food = [self.occupancy.index(pos) for pos in self.state.entities.get_food_position()]
+        food = [cell for cell in food if cell >= 0]
+        path, found = self.search(head, food, SEARCH_NODES, deadline) if food else ([], False)
+        self.path = deque(path)
+        self.target = path[-1] if found else -1
+    def repair(self, head, blocked, deadline):
+        """ Patches the route around a blocked step with a detour from head that rejoins
+            it shortly after, returns whether it could """
+        rejoin = list(islice(self.path, blocked + 1, blocked + 1 + REPAIR_HORIZON))
+        if not rejoin:
+            return False
+        #The detour mustn't cross the part of the route the snake will follow later
+        avoid = set(self.path).difference(rejoin)
+        detour, found = self.search(head, rejoin, DETOUR_NODES, deadline, avoid)
+        if not found:
+            return False
+        rest = islice(self.path, self.path.index(detour[-1]) + 1, None)
+        self.path = deque(detour + list(rest))
+        self.repairs += 1
+        return True
+    def search(self, start, goals, nodes, deadline, avoid=()):
+        """ A* from start to one of goals, looking at no more than nodes cells and
+            stopping at deadline unless it's None.
+            Returns the cells along the way after start, and whether it got there. If
+            it didn't, the route leads to the cell that got closest """
+        columns = self.occupancy.columns
+        goal_set = set(goals)
+        #Head for the nearest goal, though reaching any of them will do
+        goal_column, goal_row = min(((cell % columns, cell // columns) for cell in goal_set),
+                                    key=lambda goal: abs(goal[0] - start % columns) +
+                                    abs(goal[1] - start // columns))
+        def estimate(cell):
+            return abs(cell % columns - goal_column) + abs(cell // columns - goal_row)
+
+        #Same sum as passable() and neighbours(), done inline for speed
+        cells = self.occupancy.cells
+        last_row = len(cells) - columns
+        free_after = self.free_after()
+        neck = self.neck()
+        came_from = {start: -1}
+        closest, closest_estimate = start, estimate(start)
+        #Ties go to the cell furthest along, so open ground isn't searched side to side
+        frontier = [(closest_estimate, 0, start)]
+        found = False
+        expanded = 0
+        while frontier and not found:
+            _, minus_ticks, cell = heapq.heappop(frontier)
+            #Cells are kept with minus the tick they're reached on, their neighbours are
+            #reached a tick later
+            ticks = 1 - minus_ticks
+            expanded += 1
+            if expanded > nodes or (deadline is not None and not expanded % 64 and
+                                    time.perf_counter() > deadline):
+                break
+            near_demons = ticks <= DEMON_HORIZON
+            column = cell % columns
+            for next_cell in (cell - 1 if column else -1,
+                              cell + 1 if column < columns - 1 else -1,
+                              cell - columns,
+                              cell + columns if cell < last_row else -1):
+                if (next_cell < 0 or next_cell in came_from or next_cell in avoid or
+                        next_cell == neck and ticks == 1 or
+                        cells[next_cell] & OccupancyGrid.SNAKE and
+                        self.entered[next_cell] + free_after > ticks or
+                        near_demons and next_cell in self.danger):
+                    continue
+                came_from[next_cell] = cell
+                if next_cell in goal_set:
+                    closest, found = next_cell, True
+                    break
+                next_estimate = estimate(next_cell)
+                if next_estimate < closest_estimate:
+                    closest, closest_estimate = next_cell, next_estimate
+                heapq.heappush(frontier, (ticks + next_estimate, -ticks, next_cell))
+
+        path = []
+        while closest != start:
+            path.append(closest)
+            closest = came_from[closest]
+        path.reverse()
+        return path, found
+    def space_needed(self):
+        """ Returns how much room the snake needs to be sure it can keep moving """
+        return min(len(self.state.snake) + self.state.ruleset.fat, SPACE_LIMIT)
+    def space(self, cell, danger=True):
+        """ Counts the cells the snake could reach after moving into cell, up to
+            space_needed(). Cells its body leaves on the way are counted too """
+        needed = self.space_needed()
+        free_after = self.free_after()
+        whole_body = len(self.state.snake) + self.state.ruleset.fat
+        if not self.passable(cell, 1, free_after, danger):
+            return 0
+        #Spread out a tick at a time, the same sum as passable() done inline for speed
+        cells = self.occupancy.cells
+        columns = self.occupancy.columns
+        last_row = len(cells) - columns
+        avoid = self.danger if danger else ()
+        seen = {cell}
+        frontier = [cell]
+        ticks = 1
+        while frontier and len(seen) < needed:
+            if ticks > whole_body:
+                #The whole body has moved on by now, so there's room to spare
+                return needed
+            ticks += 1
+            near_demons = ticks <= DEMON_HORIZON and avoid
+            next_frontier = []
+            for cell in frontier:
+                column = cell % columns
+                for next_cell in (cell - 1 if column else -1,
+                                  cell + 1 if column < columns - 1 else -1,
+                                  cell - columns,
+                                  cell + columns if cell < last_row else -1):
+                    if (next_cell < 0 or next_cell in seen or
+                            cells[next_cell] & OccupancyGrid.SNAKE and
+                            self.entered[next_cell] + free_after > ticks or
+                            near_demons and next_cell in avoid):
+                        continue
+                    seen.add(next_cell)
+                    next_frontier.append(next_cell)
+            frontier = next_frontier
+        return min(len(seen), needed)
+    def demon_distance(self, cell):
+        """ Returns how far cell is from the nearest demon near the head, in pixels """
+        centre_x, centre_y = self.occupancy.position(cell)
+        centre_x, centre_y = centre_x + CELL_SIZE/2, centre_y + CELL_SIZE/2
+        return min((max(abs(demon_x - centre_x), abs(demon_y - centre_y))
+                    for demon_x, demon_y in self.nearby), default=0)
+    def survive(self, head, direction):
+        """ Returns the way with the most room, then the one that keeps clear of where
+            the demons are heading, then the one furthest from them """
+        neck = self.neck()
+        moves = [cell for cell in self.neighbours(head) if cell != neck]
+        if not moves:
+            return direction
+        best = max(moves, key=lambda cell: (self.space(cell, False), self.space(cell),
+                                            self.demon_distance(cell),
+                                            self.direction_to(head, cell) == direction))
+        return self.direction_to(head, best)
+
+def main():
+    """ Plays a headless game with the autopilot and reports how long it took to decide """
+    parser = argparse.ArgumentParser(description='Let the autopilot play a game.')
+    parser.add_argument('--board', type=int, nargs=2, metavar=('COLUMNS', 'ROWS'),
+                        help='play on a board of this many cells')
+    parser.add_argument('--demons', type=int, default=DEMONS_TO_SPAWN,
+                        help='size of the demon swarm')
+    parser.add_argument('--seed', type=int, help='seed for the game, random by default')
+    parser.add_argument('--max-ticks', type=int, help='stop the game after this many ticks')
+    args = parser.parse_args()
+
+    state = GameState(args.seed, demons=args.demons,
+                      board=Board(*args.board) if args.board else None)
+    #Played headless, so only the search limits apply and the seed always plays the same
+    pilot = Autopilot(state, budget=None)
+    start = time.perf_counter()
+    play(state, pilot, args.max_ticks)
+    elapsed = time.perf_counter() - start
+    print('Score %d, length %d, %d ticks in %.2f s' % (state.ruleset.get_score(),
+                                                      len(state.snake), state.ticks, elapsed))
+    mean, recent_worst = pilot.decision_time()
+    print('Decisions over the last %d ticks: %.3f ms on average, %.3f ms at worst' % (
+        len(pilot.decision_times), mean, recent_worst))
+    print('Slowest decision %.3f ms, %g ms budget when steering for a player' % (
+        pilot.slowest, AUTOPILOT_BUDGET))
+    print('%d full searches, %d detours' % (pilot.replans, pilot.repairs))
+    return 0
+
+#Call main
+if __name__ == "__main__":
+    raise SystemExit(main())
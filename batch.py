@@ -0,0 +1,312 @@
+"""
+---------------------------------------------
+Project: Snake Game
+File Name: batch.py
+Created by: OverworldLord
+---------------------------------------------
+This program implements the 'Snake' game,
+       as described in README.md.
+---------------------------------------------
+PYLINT NOTES
+Code style checked with pylint, using the
+following:
+
+    pylint batch.py -d no-member
+---------------------------------------------
+This file plays lots of seeded games without
+a window, spread across a pool of processes,
+so questions like "what do scores look like
+at 100 demons?" can be answered without
+sitting through them. Each game is played by
+a scripted policy, picked by name or loaded
+from another module. Results are streamed
+back as each game ends, then summed up as
+histograms of score, length, time survived
+and cause of death:
+
+    python batch.py -n 1000 --policy greedy
+    python batch.py -n 200 --demons 100 --board 40 40
+    python batch.py -n 500 --output games.jsonl --scale
+
+A policy is made once per game by calling
+factory(seed), and is then called with the
+GameState each tick to get the direction.
+Policies in other modules are given as
+module:factory.
+---------------------------------------------
+"""
+
+#Used to spread games across every core and load policies from other modules
+import multiprocessing
+import importlib
+
+#Used to time the batch and read the command line
+import time
+import argparse
+
+#Used to stream results, pick seeds and count causes of death
+import json
+import sys
+import random as rng
+from collections import Counter
+from contextlib import nullcontext
+
+#Imports the simulation core
+from engine import INPUT
+from engine import GameState
+from engine import Board
+from engine import movement_handler
+from engine import play
+from engine import DEMONS_TO_SPAWN
+
+#Imports the autopilot, which can be used as a policy
+from autopilot import Autopilot
+
+#Imports the seed picker used for new games
+from replay import new_seed
+
+#Number of games to play, and the longest a game can go on in ticks before it's stopped
+GAMES = 100
+MAX_TICKS = 100000
+
+#Number of bins in each histogram, and how wide the longest bar is in characters
+HISTOGRAM_BINS = 10
+HISTOGRAM_WIDTH = 40
+
+#How many games each worker takes at a time
+CHUNK_SIZE = 4
+
+#The ways a game can end
+DEATH_CAUSES = ('wall', 'self', 'demon', 'won', 'timeout')
+
+#Directions a policy can choose from, in the order they're tried
+DIRECTIONS = (INPUT.LEFT, INPUT.UP, INPUT.RIGHT, INPUT.DOWN)
+
+def safe_directions(state):
+    """ Returns the directions that won't run the snake into a wall or itself next tick """
+    snake = state.snake
+    occupancy = snake.occupancy
+    return [direction for direction in DIRECTIONS
+            if occupancy.board.contains(movement_handler(direction, snake)) and
+            not occupancy.snake_at(movement_handler(direction, snake))]
+
+def straight_policy(_):
+    """ Never turns, so the snake runs into the wall """
+    return lambda state: INPUT.NONE
+
+def random_policy(seed):
+    """ Turns at random, as long as it doesn't die doing it """
+    rand = rng.Random(seed)
+    def policy(state):
+        directions = safe_directions(state)
+        return rand.choice(directions) if directions else state.direction
+    return policy
+
+def greedy_policy(_):
+    """ Heads for the nearest food by the shortest safe step, ignoring the demons """
+    def policy(state):
+        head_x, head_y = state.snake.head()
+        food = state.entities.get_food_position()
+        target_x, target_y = min(food, key=lambda pos: abs(pos[0] - head_x) +
+                                 abs(pos[1] - head_y)) if food else (head_x, head_y)
+        directions = safe_directions(state)
+        if not directions:
+            return state.direction
+        return min(directions, key=lambda direction: sum(
+            abs(a - b) for a, b in zip(movement_handler(direction, state.snake),
+                                       (target_x, target_y))))
+    return policy
+
+def autopilot_policy(_):
+    """ Plans routes to the food around its body and the demons, see autopilot.py. It has
+        no time budget, so a seed plays the same however busy the machine is """
+    return Autopilot(budget=None)
+
+#Policies that can be picked by name, each maps to a factory(seed) returning the policy
+POLICIES = {'straight': straight_policy,
+            'random': random_policy,
+            'greedy': greedy_policy,
+            'autopilot': autopilot_policy}
+
+def load_policy(name):
+    """ Returns the policy factory with the given name, or from module:factory.
+        Raises ValueError if it can't be found """
+    if name in POLICIES:
+        return POLICIES[name]
+    module_name, _, factory_name = name.partition(':')
+    if not factory_name:
+        raise ValueError('unknown policy %s, pick one of %s or give module:factory'
+                         % (name, ', '.join(POLICIES)))
+    try:
+        return getattr(importlib.import_module(module_name), factory_name)
+    except (ImportError, AttributeError) as error:
+        raise ValueError('could not load policy %s: %s' % (name, error)) from error
+
+def death_cause(state):
+    """ Returns which of DEATH_CAUSES ended a finished game """
+    snake = state.snake
+    head = snake.head()
+    if state.won():
+        return 'won'
+    if not snake.occupancy.board.contains(head):
+        return 'wall'
+    if snake.occupancy.snake_at(head) > 1:
+        return 'self'
+    if state.entities.get_demon_position().catches(head):
+        return 'demon'
+    return 'timeout'
+
+def play_game(job):
+    """ Plays one headless game, job is (seed, policy, columns, rows, demons, max_ticks).
+        Returns the game's result as a dict """
+    seed, policy_name, columns, rows, demons, max_ticks = job
+    state = GameState(seed, demons=demons, board=Board(columns, rows))
+    play(state, load_policy(policy_name)(seed), max_ticks)
+    return {'seed': seed,
+            'score': state.ruleset.get_score(),
+            'length': len(state.snake),
+            'ticks': state.ticks,
+            'time_ms': state.clock.get_ticks(),
+            'cause': death_cause(state)}
+
+def run_batch(jobs, workers, on_result=None):
+    """ Plays every job across a pool of workers, calling on_result with each result as
+        it comes back. Returns the results and how long they took in seconds """
+    start = time.perf_counter()
+    results = []
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            for result in pool.imap_unordered(play_game, jobs, CHUNK_SIZE):
+                results.append(result)
+                if on_result:
+                    on_result(result)
+    else:
+        #A single worker plays in this process, so there's no pool to start up
+        for job in jobs:
+            result = play_game(job)
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return results, time.perf_counter() - start
+
+class Progress():
+    """ Called with each game's result as it comes back, streams it to a file and
+        shows how many games are done """
+    def __init__(self, total, out_file=None):
+        """ Class Constructor, out_file is where results are written as JSON lines """
+        self.total = total
+        self.done = 0
+        self.out_file = out_file
+    def __call__(self, result):
+        self.done += 1
+        if self.out_file:
+            self.out_file.write(json.dumps(result) + '\n')
+            self.out_file.flush()
+        print('%d/%d games' % (self.done, self.total), end='\r', file=sys.stderr)
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    """ Returns (low, high, count) for equal width bins covering values """
+    if not values:
+        return []
+    low, high = min(values), max(values)
+    width = max((high - low)/bins, 1)
+    counts = [0]*bins
+    for value in values:
+        counts[min(int((value - low)/width), bins - 1)] += 1
+    return [(low + width*index, low + width*(index + 1), count)
+            for index, count in enumerate(counts)]
+
+def print_histogram(title, bars, out=sys.stdout):
+    """ Prints (label, count) bars scaled to HISTOGRAM_WIDTH """
+    print(title, file=out)
+    most = max([count for _, count in bars] + [1])
+    for label, count in bars:
+        print('  %-22s %6d %s' % (label, count, '#'*(count*HISTOGRAM_WIDTH//most)), file=out)
+
+def summarize(results, bins=HISTOGRAM_BINS):
+    """ Returns the histograms of a batch's results, ready to be written as JSON """
+    summary = {}
+    for field in ('score', 'length', 'time_ms'):
+        values = [result[field] for result in results]
+        summary[field] = {'mean': sum(values)/len(values) if values else 0,
+                          'min': min(values, default=0),
+                          'max': max(values, default=0),
+                          'bins': histogram(values, bins)}
+    causes = Counter(result['cause'] for result in results)
+    summary['cause'] = {cause: causes[cause] for cause in DEATH_CAUSES}
+    return summary
+
+def print_summary(summary, out=sys.stdout):
+    """ Prints a batch's histograms """
+    for field, title in (('score', 'Score'), ('length', 'Length'),
+                         ('time_ms', 'Time survived (s)')):
+        stats = summary[field]
+        scale = 1000 if field == 'time_ms' else 1
+        print_histogram('%s: mean %.1f, min %g, max %g' % (
+            title, stats['mean']/scale, round(stats['min']/scale, 1),
+            round(stats['max']/scale, 1)),
+                        [('%g - %g' % (round(low/scale, 1), round(high/scale, 1)), count)
+                         for low, high, count in stats['bins']], out)
+    print_histogram('Cause of death', list(summary['cause'].items()), out)
+
+def main():
+    """ Runs a batch of headless games from the command line """
+    parser = argparse.ArgumentParser(description='Play a batch of headless games.')
+    parser.add_argument('-n', '--games', type=int, default=GAMES, help='games to play')
+    parser.add_argument('--policy', default='greedy',
+                        help='policy to play with: %s, or module:factory' % ', '.join(POLICIES))
+    parser.add_argument('--demons', type=int, default=DEMONS_TO_SPAWN,
+                        help='size of the demon swarm')
+    parser.add_argument('--board', type=int, nargs=2, metavar=('COLUMNS', 'ROWS'),
+                        help='play on a board of this many cells')
+    parser.add_argument('--seed', type=int, help='seed for the games\' seeds, random by default')
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS,
+                        help='stop a game that has gone on this many ticks')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='processes to play games in')
+    parser.add_argument('--scale', action='store_true',
+                        help='play the batch again on 1, 2, 4... workers to show throughput')
+    parser.add_argument('--bins', type=int, default=HISTOGRAM_BINS, help='histogram bins')
+    parser.add_argument('--output', help='stream each game\'s result to this JSON lines file')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    try:
+        load_policy(args.policy)
+    except ValueError as error:
+        parser.error(str(error))
+    board = Board(*args.board) if args.board else Board()
+    seeds = rng.Random(args.seed if args.seed is not None else new_seed())
+    jobs = [(seeds.getrandbits(64), args.policy, board.columns, board.rows, args.demons,
+             args.max_ticks) for _ in range(0, args.games)]
+
+    with open(args.output, 'w') if args.output else nullcontext() as out_file:
+        results, elapsed = run_batch(jobs, args.workers, Progress(len(jobs), out_file))
+    print(file=sys.stderr)
+
+    summary = summarize(results, args.bins)
+    summary['throughput'] = {str(args.workers): len(results)/elapsed}
+    if args.scale:
+        #Every run plays the same games, so only the time they take changes
+        workers = 1
+        while workers <= args.workers:
+            if workers != args.workers:
+                summary['throughput'][str(workers)] = len(jobs)/run_batch(jobs, workers)[1]
+            workers *= 2
+
+    if args.json:
+        json.dump(summary, sys.stdout, indent=1)
+        print()
+        return 0
+    print('%d games of %s on a %dx%d board with %d demon(s)' % (
+        len(results), args.policy, board.columns, board.rows, args.demons))
+    print_summary(summary)
+    single = summary['throughput'].get('1')
+    for workers, rate in sorted(summary['throughput'].items(), key=lambda item: int(item[0])):
+        print('%3s worker(s): %9.1f games/s%s' % (
+            workers, rate, '  x%.2f' % (rate/single) if single else ''))
+    return 0
+
+#Call main
+if __name__ == "__main__":
+    raise SystemExit(main())
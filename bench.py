@@ -0,0 +1,272 @@
+"""
+---------------------------------------------
+Project: Snake Game
+File Name: bench.py
+Created by: OverworldLord
+---------------------------------------------
+This program implements the 'Snake' game,
+       as described in README.md.
+---------------------------------------------
+PYLINT NOTES
+Code style checked with pylint, using the
+following:
+
+    pylint bench.py -d no-member
+---------------------------------------------
+This file benchmarks the game's hot paths:
+the rules, the food and demon handler and
+each stage of drawing a frame. Every
+benchmark is run on synthetic snakes from a
+single segment up to the win length, against
+one demon, the 100 demons of IMPOSSIBLE_MODE
+and a swarm of 1000. It runs headless using SDL's
+dummy drivers. Results are written as JSON,
+and can be compared against an earlier run
+to catch regressions:
+
+    python bench.py --output baseline.json
+    python bench.py --baseline baseline.json
+
+Comparing exits with status 1 if anything is
+more than --threshold slower than baseline.
+---------------------------------------------
+"""
+
+#Run without a window or audio device, must be set before pygame is imported
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+#pylint: disable=wrong-import-position
+#Used to time each benchmark and read the command line
+import timeit
+import argparse
+
+#Used to output and read results
+import json
+import platform
+import sys
+from datetime import datetime
+
+#Used to place the demons the same way every run
+import random as rng
+
+#Import pygame
+import pygame
+
+#Imports the simulation core
+from engine import GameRules
+from engine import NonPlayerEntityHandler
+from engine import SnakeBody
+from engine import OccupancyGrid
+from engine import Board
+from engine import INPUT
+from engine import movement_handler
+from engine import GRID_SIZE_X
+from engine import GRID_SIZE_Y
+from engine import CELL_SIZE
+
+#Imports the display
+from scene import DisplayUpdater
+#pylint: enable=wrong-import-position
+
+#Snake lengths to benchmark, up to the length that wins the game
+WIN_LENGTH = (GRID_SIZE_X//CELL_SIZE)*(GRID_SIZE_Y//CELL_SIZE) - 1
+SNAKE_LENGTHS = (1, 50, 100, 200, 400, WIN_LENGTH)
+
+#Demon counts to benchmark: normal play, IMPOSSIBLE_MODE and a big swarm
+DEMON_COUNTS = (1, 100, 1000)
+
+#Seed for the demon positions and the display's glitch effects
+BENCH_SEED = 1976
+
+#How long each timing run lasts at least, in seconds, and how many are taken. The
+#fastest run is kept, as it's the one least disturbed by the rest of the machine.
+MIN_TIME = 0.05
+REPEATS = 5
+
+#How much slower than baseline a benchmark can be before it counts as a regression
+THRESHOLD = 0.25
+
+def synthetic_snake(length, board=None):
+    """ Returns a snake of the given length, winding back and forth across the board
+        from the top left with its head at the far end """
+    board = board if board is not None else Board()
+    cells_x = board.columns
+    path = []
+    for cell in range(0, length):
+        row, col = divmod(cell, cells_x)
+        if row % 2:
+            col = cells_x - 1 - col
+        path.append((col*CELL_SIZE, row*CELL_SIZE))
+    snake = SnakeBody(path[0], OccupancyGrid(board=board))
+    for segment in path[1:]:
+        snake.push_head(segment)
+    return snake
+
+def synthetic_entities(snake, demons):
+    """ Returns a food and demon handler for snake, with demons spread around the board
+        where they won't catch the snake """
+    rand = rng.Random(BENCH_SEED)
+    board = snake.occupancy.board
+    entities = NonPlayerEntityHandler(snake, rand, demons)
+    entities.demon.place([[rand.randrange(-50, board.width + 50),
+                           rand.randrange(board.height//2, board.height + 50)]
+                          for _ in range(0, demons)])
+    return entities
+
+def snapshot(entities):
+    """ Returns everything set_food_position and set_demon_position change, so it can
+        be put back with restore """
+    demon = entities.demon
+    generator = demon.generator.bit_generator.state if demon.generator is not None else None
+    return ([list(food_item) for food_item in entities.pos], [list(pos) for pos in demon],
+            entities.rng.getstate(), generator)
+
+def restore(entities, snake, saved):
+    """ Puts the food, demons and random state back the way snapshot found them """
+    food, demons, rng_state, generator = saved
+    for food_item in entities.pos:
+        snake.occupancy.set_food(food_item, False)
+    entities.pos = [list(food_item) for food_item in food]
+    for food_item in entities.pos:
+        snake.occupancy.set_food(food_item, True)
+    entities.demon.place(demons)
+    entities.rng.setstate(rng_state)
+    if generator is not None:
+        entities.demon.generator.bit_generator.state = generator
+
+def time_call(function, setup=None, min_time=MIN_TIME, repeats=REPEATS):
+    """ Returns the best time for one call of function, in microseconds. setup is run
+        before every timing run, outside the time taken """
+    timer = timeit.Timer(function, setup) if setup else timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeats, number))/number*1e6
+
+def benchmarks(display, length, demons, board=None):
+    """ Returns (name, function, setup) for each benchmark on a snake of the given
+        length. setup puts the food and demons back where they started, so every timing
+        run of every benchmark sees the same board """
+    snake = synthetic_snake(length, board)
+    entities = synthetic_entities(snake, demons)
+    saved = snapshot(entities)
+    def setup():
+        restore(entities, snake, saved)
+    ruleset = GameRules()
+    food = entities.get_food_position()
+    demon = entities.get_demon_position()
+
+    def redraw_dirty():
+        display.redraw_dirty(snake, food, demon, ruleset.get_score())
+    def redraw_full():
+        display.redraw_full(snake, food, demon, ruleset.get_score())
+    #Look at the snake's head, and leave a frame for redraw_dirty to patch up
+    display.camera.follow(snake.head())
+    redraw_full()
+
+    stages = [('player_loss', lambda: ruleset.player_loss(snake, demon)),
+              ('player_eats_food', lambda: ruleset.player_eats_food(snake, food)),
+              ('set_food_position', lambda: entities.set_food_position(snake)),
+              ('set_demon_position', lambda: entities.set_demon_position(snake)),
+              ('movement_handler', lambda: movement_handler(INPUT.DOWN, snake)),
+              ('draw_snake', lambda: display.draw_snake(snake)),
+              ('draw_food', lambda: display.draw_food(snake, food)),
+              ('draw_grid', lambda: display.draw_grid(snake)),
+              ('draw_demon', lambda: display.draw_demon(demon, snake)),
+              ('draw_score', lambda: display.draw_score(ruleset.get_score())),
+              ('redraw_full', redraw_full)]
+    #A scrolling view is always redrawn in full
+    if not display.camera.scrolls:
+        stages.append(('redraw_dirty', redraw_dirty))
+    return [(name, function, setup) for name, function in stages]
+
+def run(lengths=SNAKE_LENGTHS, demon_counts=DEMON_COUNTS, only=None, min_time=MIN_TIME,
+        repeats=REPEATS, board=None):
+    """ Runs every benchmark, returns the results ready to be written as JSON """
+    pygame.init()
+    display = DisplayUpdater()
+    board = board if board is not None else Board()
+    display.set_board(board)
+    rng.seed(BENCH_SEED)
+
+    results = []
+    for demons in demon_counts:
+        for length in lengths:
+            for name, function, setup in benchmarks(display, length, demons, board):
+                if only and not any(part in name for part in only):
+                    continue
+                microseconds = time_call(function, setup, min_time, repeats)
+                results.append({'name': name, 'length': length, 'demons': demons,
+                                'us_per_call': round(microseconds, 3)})
+                print('%-20s length %4d  demons %4d  %12.2f us' % (name, length, demons,
+                                                                     microseconds),
+                      file=sys.stderr)
+    return {'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'machine': platform.platform(),
+            'board': [board.columns, board.rows],
+            'results': results}
+
+def compare(report, baseline, threshold=THRESHOLD):
+    """ Prints how each result compares to baseline, returns the regressions """
+    old = {(result['name'], result['length'], result['demons']): result['us_per_call']
+           for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        key = (result['name'], result['length'], result['demons'])
+        if key not in old or not old[key]:
+            continue
+        change = result['us_per_call']/old[key] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        print('%-20s length %4d  demons %4d  %12.2f -> %12.2f us  %+7.1f%%%s'
+              % (key + (old[key], result['us_per_call'], change*100, flag)))
+    return regressions
+
+def main():
+    """ Runs the benchmarks from the command line """
+    parser = argparse.ArgumentParser(description='Benchmark the game\'s hot paths.')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction slower than baseline that counts as a regression')
+    parser.add_argument('--lengths', type=int, nargs='+', default=SNAKE_LENGTHS,
+                        help='snake lengths to benchmark')
+    parser.add_argument('--demons', type=int, nargs='+', default=DEMON_COUNTS,
+                        help='demon counts to benchmark')
+    parser.add_argument('--only', nargs='+', help='only run benchmarks with these in the name')
+    parser.add_argument('--board', type=int, nargs=2, metavar=('COLUMNS', 'ROWS'),
+                        help='benchmark on a board of this many cells instead')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help='shortest time in seconds for each timing run')
+    parser.add_argument('--repeats', type=int, default=REPEATS,
+                        help='number of timing runs to take the best of')
+    args = parser.parse_args()
+
+    board = Board(*args.board) if args.board else None
+    report = run(args.lengths, args.demons, args.only, args.min_time, args.repeats, board)
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=1)
+    elif not args.baseline:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as in_file:
+            baseline = json.load(in_file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print('%d benchmark(s) regressed by more than %d%%' % (len(regressions),
+                                                                  args.threshold*100))
+            return 1
+    return 0
+
+#Call main
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,642 @@
+"""
+---------------------------------------------
+Project: Snake Game
+File Name: engine.py
+Created by: OverworldLord
+---------------------------------------------
+This program implements the 'Snake' game,
+       as described in README.md.
+---------------------------------------------
+PYLINT NOTES
+Code style checked with pylint, using the
+following:
+
+    pylint engine.py -d no-member
+---------------------------------------------
+This file defines the simulation core of the
+snake game. Nothing in here touches pygame,
+so the rules can be run without a window or
+an audio device. Classes are as follows:
+INPUT - Enumerator used for valid types of
+        input from the user.
+
+GameRules - Handles the logic behind the
+            game itself, including what
+            should happen if the snake eats
+            food, when they win or lose.
+
+NonPlayerEntityHandler - Handles the logic
+                         behind entities
+                         within the game,
+                         such as food or
+                         other things with
+                         a... peculiar AI.
+
+Board - The size of the board, which can be
+        bigger than the screen.
+
+FreeCellIndex - Set of empty cells that can
+                be picked from at random.
+
+OccupancyGrid - Tracks which cells of the
+                board hold the snake or food.
+
+SnakeBody - The snake itself, stored as a
+            ring buffer of cells.
+
+DemonSwarm - Every demon's position, moved
+             as a batch with NumPy when the
+             swarm is big.
+
+SimulatedClock - Stand-in for pygame.time
+                 that only moves when told.
+
+GameState - Holds everything about a single
+            game in progress.
+
+The functions step(), update() and
+move_demons() advance a GameState; play()
+runs a whole game using a policy.
+---------------------------------------------
+"""
+
+#Used for all random decisions
+import random as rng
+
+#Used for enumerator involving user input
+from enum import Enum
+
+#Used to store the snake's body compactly
+from array import array
+
+#Used to move large demon swarms as whole arrays. Optional, demons are moved one at a
+#time without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class INPUT(Enum):
+    """Enumerator, used for getting user input"""
+    NONE = 0
+    LEFT = 1
+    UP = 2
+    RIGHT = 3
+    DOWN = 4
+    ENTER = 5
+    BACKSPACE = 6
+    SPACE = 7
+    ESCAPE = 8
+    C = 9
+
+#Minimum and maximum game speed in ms
+LOWER_BOUND, UPPER_BOUND = 100, 300
+
+#Time between demon moves in ms
+DEMON_INTERVAL = 100
+
+#Time between passive score increases in ms
+SCORE_INTERVAL = 3000
+
+#Size of the entire grid
+GRID_SIZE_X, GRID_SIZE_Y = 600, 600
+
+#Size of every cell on the grid
+CELL_SIZE = 24
+
+#Amount of fat the snake should start with
+STARTING_FAT = 0
+
+#Whether or not to make things impossibly difficult
+IMPOSSIBLE_MODE = False
+
+#Number of demons to spawn
+DEMONS_TO_SPAWN = 1 + 99*IMPOSSIBLE_MODE
+
+#Swarms at least this big are moved with NumPy, if it's installed. Smaller swarms are
+#quicker to move one demon at a time.
+VECTORIZED_DEMONS = 32
+
+#Demons spawn in staggered rows off the board, this many rows deep before starting over
+DEMON_SPAWN_ROWS = 100
+
+class Board():
+    """ The size of the board in cells, each CELL_SIZE pixels across """
+    def __init__(self, columns=GRID_SIZE_X // CELL_SIZE, rows=GRID_SIZE_Y // CELL_SIZE):
+        """ Class Constructor, the default board is the one that fits the screen """
+        self.columns = columns
+        self.rows = rows
+        self.cells = columns*rows
+        self.width = columns*CELL_SIZE
+        self.height = rows*CELL_SIZE
+    def contains(self, pos):
+        """ Whether the (x, y) position pos is on the board """
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.height
+    def centre(self):
+        """ Returns the position of the cell in the middle of the board """
+        return (self.width//2 - self.width//2 % CELL_SIZE,
+                self.height//2 - self.height//2 % CELL_SIZE)
+
+class FreeCellIndex():
+    """ Set of empty cell indices with O(1) add, remove and uniform random picks """
+    def __init__(self, size):
+        """ Class Constructor, every cell from 0 to size starts out free """
+        #Cells are stored in a list so a random one can be picked by position, slot
+        #remembers where each cell is in that list (-1 if it isn't free)
+        self.cells = list(range(0, size))
+        self.slot = list(range(0, size))
+    def __len__(self):
+        return len(self.cells)
+    def __contains__(self, cell):
+        return self.slot[cell] >= 0
+    def add(self, cell):
+        """ Marks a cell as free """
+        if self.slot[cell] < 0:
+            self.slot[cell] = len(self.cells)
+            self.cells.append(cell)
+    def remove(self, cell):
+        """ Marks a cell as taken, by swapping the last free cell into its slot """
+        slot = self.slot[cell]
+        if slot >= 0:
+            last = self.cells.pop()
+            if last != cell:
+                self.cells[slot] = last
+                self.slot[last] = slot
+            self.slot[cell] = -1
+    def choice(self, rand):
+        """ Returns a uniformly random free cell, or -1 if none are left """
+        if not self.cells:
+            return -1
+        return self.cells[rand.randrange(0, len(self.cells))]
+
+class OccupancyGrid():
+    """ Tracks what is in every cell of the board, so lookups don't scan the snake """
+    #Each cell holds how many snake segments are in it, plus a flag if food is there
+    FOOD = 0x80
+    SNAKE = 0x7f
+    def __init__(self, snake=(), board=None):
+        """ Class Constructor, every cell starts empty apart from the given snake """
+        self.board = board if board is not None else Board()
+        self.columns = self.board.columns
+        self.rows = self.board.rows
+        self.width = self.board.width
+        self.height = self.board.height
+        self.cells = bytearray(self.columns*self.rows)
+        #Cells with neither snake nor food in them
+        self.free = FreeCellIndex(self.columns*self.rows)
+        for body_segment in snake:
+            self.add_snake(body_segment)
+    def index(self, pos):
+        """ Returns the cell index of an (x, y) position, or -1 if it's off the board """
+        pos_x, pos_y = pos
+        if pos_x < 0 or pos_x >= self.width or pos_y < 0 or pos_y >= self.height:
+            return -1
+        return int(pos_y // CELL_SIZE)*self.columns + int(pos_x // CELL_SIZE)
+    def position(self, cell):
+        """ Returns the (x, y) position of the top left of a cell """
+        return (cell % self.columns)*CELL_SIZE, (cell // self.columns)*CELL_SIZE
+    def update_free(self, cell):
+        """ Keeps the free cell index in step with a cell that's just changed """
+        if self.cells[cell]:
+            self.free.remove(cell)
+        else:
+            self.free.add(cell)
+    def add_snake(self, pos):
+        """ Marks a snake segment as being in the cell at pos """
+        cell = self.index(pos)
+        if cell >= 0:
+            self.cells[cell] += 1
+            self.update_free(cell)
+    def remove_snake(self, pos):
+        """ Removes a snake segment from the cell at pos """
+        cell = self.index(pos)
+        if cell >= 0 and self.cells[cell] & self.SNAKE:
+            self.cells[cell] -= 1
+            self.update_free(cell)
+    def snake_at(self, pos):
+        """ Returns how many snake segments are in the cell at pos """
+        cell = self.index(pos)
+        return self.cells[cell] & self.SNAKE if cell >= 0 else 0
+    def set_food(self, pos, present):
+        """ Marks whether there is food in the cell at pos """
+        cell = self.index(pos)
+        if cell >= 0:
+            if present:
+                self.cells[cell] |= self.FOOD
+            else:
+                self.cells[cell] &= self.SNAKE
+            self.update_free(cell)
+    def food_at(self, pos):
+        """ Returns whether there is food in the cell at pos """
+        cell = self.index(pos)
+        return cell >= 0 and bool(self.cells[cell] & self.FOOD)
+    def random_free_position(self, rand):
+        """ Returns the position of a random cell with nothing in it, or None if the
+            board is full """
+        cell = self.free.choice(rand)
+        return self.position(cell) if cell >= 0 else None
+
+class SnakeBody():
+    """ The snake, head first. Segments are stored as cell coordinates in a ring
+        buffer, so moving the head and dropping the tail are both O(1) """
+    __slots__ = ('cell_x', 'cell_y', 'start', 'length', 'occupancy')
+    def __init__(self, head, occupancy=None):
+        """ Class Constructor, head is the (x, y) position of the only segment """
+        #Room for a snake that fills the board, plus a head that's gone off of it
+        self.occupancy = occupancy if occupancy is not None else OccupancyGrid()
+        capacity = len(self.occupancy.cells) + 1
+        self.cell_x = array('h', bytes(2*capacity))
+        self.cell_y = array('h', bytes(2*capacity))
+        self.start = 0
+        self.length = 0
+        self.push_head(head)
+    def __len__(self):
+        return self.length
+    def __getitem__(self, segment):
+        """ Returns the (x, y) position of a segment, 0 being the head """
+        if segment < 0:
+            segment += self.length
+        if not 0 <= segment < self.length:
+            raise IndexError("snake segment out of range")
+        slot = (self.start + segment) % len(self.cell_x)
+        return self.cell_x[slot]*CELL_SIZE, self.cell_y[slot]*CELL_SIZE
+    def __iter__(self):
+        """ Yields the (x, y) position of every segment, head first """
+        capacity = len(self.cell_x)
+        for segment in range(self.start, self.start + self.length):
+            slot = segment % capacity
+            yield self.cell_x[slot]*CELL_SIZE, self.cell_y[slot]*CELL_SIZE
+    def head(self):
+        """ Returns the (x, y) position of the head """
+        return self.cell_x[self.start]*CELL_SIZE, self.cell_y[self.start]*CELL_SIZE
+    def push_head(self, pos):
+        """ Adds a new head at the (x, y) position pos """
+        if self.length == len(self.cell_x):
+            self.grow()
+        self.start = (self.start - 1) % len(self.cell_x)
+        self.cell_x[self.start] = int(pos[0] // CELL_SIZE)
+        self.cell_y[self.start] = int(pos[1] // CELL_SIZE)
+        self.length += 1
+        self.occupancy.add_snake(pos)
+    def pop_tail(self):
+        """ Removes the tail and returns its (x, y) position """
+        tail = self[-1]
+        self.length -= 1
+        self.occupancy.remove_snake(tail)
+        return tail
+    def grow(self):
+        """ Doubles the ring buffer's capacity, keeping the segments in order """
+        capacity = len(self.cell_x)
+        for coords in (self.cell_x, self.cell_y):
+            ordered = coords[self.start:] + coords[:self.start]
+            coords[:] = ordered + array('h', bytes(2*capacity))
+        self.start = 0
+
+class GameRules():
+    """ Holds game rules, determines what should happen upon game interaction """
+    def __init__(self):
+        self.score = 0
+        self.fat = STARTING_FAT
+    def add_to_score(self, score):
+        """ add points to our score """
+        self.score += score
+    def get_score(self):
+        """ return our current score """
+        return self.score
+    def player_eats_food(self, snake, food):
+        """Check whether the player is currently eating food, add fat and return true if so"""
+        head = snake.head()
+        #The snake's grid marks every food item, so most ticks only check a single cell
+        if not snake.occupancy.food_at(head):
+            return False
+        #Return whether or not the player's received food, adds fat if they have
+        if list(head) in food:
+            #We've eaten food, update our score
+            self.score += int(150 + int(len(snake)/10)*5)
+
+            #Add more fat to the user if they already have some or they have a decent score
+            self.fat += 8 + int(self.fat/4) + int(self.score/500)
+            return True
+        return False
+
+    def player_loss(self, snake, demon):
+        """Checks if the player has lost, returns true if so"""
+        #Get the snake's head
+        head = snake.head()
+
+        #If the head has moved out of bounds, we've lost
+        if not snake.occupancy.board.contains(head):
+            return True
+
+        #If the head has hit the body, we've lost. The grid counts the head too, so a
+        #second segment in its cell means a collision.
+        if snake.occupancy.snake_at(head) > 1:
+            return True
+
+        #If the demon's too close to the head
+        if demon.catches(head):
+            return True
+
+        #Since none of the above conditions have applied, we haven't lost yet
+        return False
+    def player_win(self, snake):
+        """ whether the player has met a win condition """
+        return len(snake) >= snake.occupancy.board.cells - 1
+    def player_burn_fat(self):
+        """ burns fat from the snake """
+        #If the player has fat, burn it and make them grow
+        if self.fat > 0:
+            #Slightly increase our score counter
+            self.score += int(int(self.fat/5)*5 + 20)
+            self.fat -= 1
+            return True
+        return False
+
+class NonPlayerEntityHandler():
+    """ Handles all non-player entities (food, demon) """
+    def __init__(self, snake, rand=rng, demons=DEMONS_TO_SPAWN, vectorize=None):
+        """ Class Constructor, rand is the source of every random decision. demons is
+            the size of the swarm, see DemonSwarm for vectorize """
+        self.rng = rand
+        self.pos = []
+        self.set_food_position(snake)
+        self.demon = DemonSwarm(demons, self.rng, vectorize, snake.occupancy.board)
+    def set_food_position(self, snake):
+        """ Moves the food to a new board location """
+        #Food is only placed in cells the snake's grid says are free
+        occupancy = snake.occupancy
+        for food_item in self.pos:
+            occupancy.set_food(food_item, False)
+        self.pos = []
+
+        #Spawn more food the longer the snake gets, as long as there's room for it
+        for _ in range(0, 1 + int(len(snake)/80)):
+            food_position = occupancy.random_free_position(self.rng)
+            if food_position is None:
+                break
+            #Marking the food takes its cell out of the free index for the next item
+            occupancy.set_food(food_position, True)
+            self.pos.append(list(food_position))
+    def demon_active(self, snake):
+        """ Checks and returns whether or not the demon is active """
+        #Return whether or not the demon should be active
+        return len(snake) > 50
+    def set_demon_position(self, snake):
+        """ Sets the demon's current position """
+        #Only move the demon if the snake is long enough
+        if self.demon_active(snake):
+            self.demon.move_towards(snake.head(), len(snake))
+    def get_demon_position(self):
+        """ Gets the demon's current position """
+        return self.demon
+    def get_food_position(self):
+        """ Gets the food's current position """
+        return self.pos
+
+class DemonSwarm():
+    """ The demons, each an (x, y) position in pixels. Big swarms are kept in a NumPy
+        array and moved, checked and filtered as a whole """
+    def __init__(self, count, rand=rng, vectorize=None, board=None):
+        """ Class Constructor, spawns count demons off the board. vectorize picks NumPy
+            (True) or plain lists (False), by default NumPy is used for big swarms """
+        if board is None:
+            board = Board()
+        if vectorize is None:
+            vectorize = numpy is not None and count >= VECTORIZED_DEMONS
+        if vectorize and numpy is None:
+            raise ValueError("a vectorized demon swarm needs NumPy")
+        self.vectorized = vectorize
+        self.rng = rand
+
+        #Demons start off in the corners, in staggered rows so they don't all arrive at once
+        positions = []
+        for indiv_demon in range(0, count):
+            demon_x = -50 + (board.width + 100)*self.rng.randrange(0, 2)
+            demon_y = (-50 + 10*(indiv_demon % DEMON_SPAWN_ROWS) +
+                       (board.height + 100)*self.rng.randrange(0, 2))
+            positions.append([demon_x, demon_y])
+
+        #The whole swarm's random moves come from one generator, seeded from the game's
+        self.generator = None
+        if self.vectorized:
+            self.generator = numpy.random.Generator(numpy.random.PCG64(
+                self.rng.getrandbits(64)))
+        self.place(positions)
+    def place(self, positions):
+        """ Moves the demons to the given [x, y] positions """
+        if self.vectorized:
+            self.positions = numpy.array(positions, dtype=float).reshape(-1, 2)
+        else:
+            self.positions = [list(position) for position in positions]
+    def __len__(self):
+        return len(self.positions)
+    def __iter__(self):
+        """ Yields the [x, y] position of every demon """
+        if self.vectorized:
+            return iter(self.positions.tolist())
+        return iter(self.positions)
+    def __getitem__(self, demon):
+        """ Returns the [x, y] position of a demon """
+        if self.vectorized:
+            return self.positions[demon].tolist()
+        return self.positions[demon]
+    def move_towards(self, head, length):
+        """ Moves every demon towards the head of a snake of the given length. Demons
+            move further the longer the snake is, and faster along the axis they're
+            closest on """
+        head_x, head_y = head
+        if not self.vectorized:
+            for indiv_demon in self.positions:
+                #Get demon's x and y values
+                demon_x, demon_y = indiv_demon
+
+                #Set amount to move in x, y
+                move_x = self.rng.randrange(2, int(length / 12))
+                move_y = self.rng.randrange(2, int(length / 12))
+
+                if abs(demon_x - head_x) > abs(demon_y - head_y):
+                    move_x /= 2
+                    move_y += 2*IMPOSSIBLE_MODE
+                else:
+                    move_x += 2*IMPOSSIBLE_MODE
+                    move_y /= 2
+
+                #Move closer to the player in the x and y INPUTections
+                indiv_demon[0] = demon_x + (move_x if head_x + CELL_SIZE/2 > demon_x
+                                            else -move_x)
+                indiv_demon[1] = demon_y + (move_y if head_y + CELL_SIZE/2 > demon_y
+                                            else -move_y)
+            return
+
+        #The same moves as above, for every demon at once
+        demon_x, demon_y = self.positions[:, 0], self.positions[:, 1]
+        moves = self.generator.integers(2, int(length / 12), size=(len(self.positions), 2))
+        move_x, move_y = moves[:, 0].astype(float), moves[:, 1].astype(float)
+        far_x = numpy.abs(demon_x - head_x) > numpy.abs(demon_y - head_y)
+        move_x = numpy.where(far_x, move_x/2, move_x + 2*IMPOSSIBLE_MODE)
+        move_y = numpy.where(far_x, move_y + 2*IMPOSSIBLE_MODE, move_y/2)
+        demon_x += numpy.where(head_x + CELL_SIZE/2 > demon_x, move_x, -move_x)
+        demon_y += numpy.where(head_y + CELL_SIZE/2 > demon_y, move_y, -move_y)
+    def catches(self, head):
+        """ Whether any demon is inside the cell at head """
+        head_x, head_y = head
+        if not self.vectorized:
+            for demon_x, demon_y in self.positions:
+                if (head_x < demon_x < head_x + CELL_SIZE and
+                        head_y < demon_y < head_y + CELL_SIZE):
+                    return True
+            return False
+        demon_x, demon_y = self.positions[:, 0], self.positions[:, 1]
+        return bool(numpy.any((head_x < demon_x) & (demon_x < head_x + CELL_SIZE) &
+                              (head_y < demon_y) & (demon_y < head_y + CELL_SIZE)))
+    def within(self, left, top, right, bottom):
+        """ Returns the [x, y] positions of the demons inside the given box """
+        if not self.vectorized:
+            return [position for position in self.positions
+                    if left <= position[0] < right and top <= position[1] < bottom]
+        demon_x, demon_y = self.positions[:, 0], self.positions[:, 1]
+        inside = (left <= demon_x) & (demon_x < right) & (top <= demon_y) & (demon_y < bottom)
+        return self.positions[inside].tolist()
+
+class SimulatedClock():
+    """ Drop-in for pygame.time, time only passes when advance_to is called """
+    def __init__(self, start=0):
+        self.ticks = start
+    def get_ticks(self):
+        """ Returns the current time in ms """
+        return self.ticks
+    def advance_to(self, ticks):
+        """ Moves the clock forward to the given time in ms """
+        self.ticks = max(self.ticks, ticks)
+
+class GameState():
+    """ Holds the snake, rules, entities and timers of a single game """
+    def __init__(self, seed=None, clock=None, demons=DEMONS_TO_SPAWN, vectorize=None,
+                 board=None):
+        """ Class Constructor, clock needs get_ticks() (and advance_to() for step).
+            demons is the size of the swarm, see DemonSwarm for vectorize. board is
+            the Board to play on, the one that fits the screen by default """
+        #Every random decision in the game comes from here, so a seed replays a game
+        self.seed = seed
+        self.rng = rng.Random(seed)
+        self.clock = clock if clock is not None else SimulatedClock()
+
+        #Get the game rules
+        self.ruleset = GameRules()
+
+        #Create a new snake that will act as a queue, the head is location 0 and tail is
+        #location n. Its grid is kept in sync with the snake and food, so collision and
+        #eating checks are O(1).
+        self.board = board if board is not None else Board()
+        self.snake = SnakeBody(self.board.centre(), OccupancyGrid(board=self.board))
+
+        #Create a food handler
+        self.entities = NonPlayerEntityHandler(self.snake, self.rng, demons, vectorize)
+
+        #Set a direction to start off with
+        self.direction = INPUT.RIGHT
+
+        #Timers for the passive score and the demon
+        self.add_score_time = self.clock.get_ticks()
+        self.next_demon_time = self.clock.get_ticks() + DEMON_INTERVAL
+
+        #What happened during the last update
+        self.ate_food = False
+        self.ticks = 0
+    def lost(self):
+        """ Whether the player has lost """
+        return self.ruleset.player_loss(self.snake, self.entities.get_demon_position())
+    def won(self):
+        """ Whether the player has won """
+        return self.ruleset.player_win(self.snake)
+    def over(self):
+        """ Whether the game has ended for any reason """
+        return self.direction == INPUT.ESCAPE or self.lost() or self.won()
+
+def tick_length(snake):
+    """ Returns the length of a logic tick in ms, the game speeds up as the snake grows """
+    return max(UPPER_BOUND - len(snake)/2, LOWER_BOUND)
+
+def movement_handler(new_direction, snake):
+    """ Handles movement for the snake, returns the new head position """
+    #Get the head of the snake
+    new_x, new_y = snake.head()
+    #Update the new head position based on where the snake moved
+    if new_direction == INPUT.LEFT:
+        new_x -= CELL_SIZE
+    elif new_direction == INPUT.UP:
+        new_y -= CELL_SIZE
+    elif new_direction == INPUT.RIGHT:
+        new_x += CELL_SIZE
+    else: #new_direction == INPUT.DOWN:
+        new_y += CELL_SIZE
+
+    #We will update the position of the snake's head
+    if len(snake) >= 2:
+        old_x, old_y = snake[1]
+    else:
+        old_x, old_y = -1, -1
+
+    #If the player is running into themselves, reverse their INPUTection
+    if new_x == old_x and new_y == old_y:
+        if new_direction == INPUT.LEFT:
+            new_x += CELL_SIZE*2
+        elif new_direction == INPUT.UP:
+            new_y += CELL_SIZE*2
+        elif new_direction == INPUT.RIGHT:
+            new_x -= CELL_SIZE*2
+        else: #new_direction == INPUT.DOWN:
+            new_y -= CELL_SIZE*2
+    return new_x, new_y
+
+def move_demons(state):
+    """ Moves every demon once towards the snake's head """
+    state.entities.set_demon_position(state.snake)
+
+def update(state, direction):
+    """ Runs the end of a logic tick: scoring, moving, eating and growing.
+        Returns whether the snake moved """
+    state.ate_food = False
+    if direction != INPUT.NONE:
+        state.direction = direction
+
+    #Nothing moves once the game is over
+    if state.over():
+        return False
+
+    #Add score to the player every three seconds
+    if state.add_score_time <= state.clock.get_ticks():
+        state.ruleset.add_to_score(5)
+        state.add_score_time += SCORE_INTERVAL
+
+    #Update the new head
+    state.snake.push_head(movement_handler(state.direction, state.snake))
+
+    #Check if the player's eaten food
+    if state.ruleset.player_eats_food(state.snake, state.entities.get_food_position()):
+        state.entities.set_food_position(state.snake)
+        state.ate_food = True
+
+    #If the snake isn't burning fat to grow, remove the old position of the tail
+    if not state.ruleset.player_burn_fat():
+        state.snake.pop_tail()
+    state.ticks += 1
+    return True
+
+def step(state, direction):
+    """ Advances the game by one whole logic tick on the state's clock """
+    #Demons move on their own timer while the tick is waiting
+    tick_end = state.clock.get_ticks() + tick_length(state.snake)
+    while state.next_demon_time <= tick_end and not state.over():
+        state.clock.advance_to(state.next_demon_time)
+        move_demons(state)
+        state.next_demon_time += DEMON_INTERVAL
+    state.clock.advance_to(tick_end)
+    update(state, direction)
+    return state
+
+def play(state, policy, max_ticks=None):
+    """ Runs a game to the end, policy(state) returns the direction for each tick """
+    while not state.over() and (max_ticks is None or state.ticks < max_ticks):
+        step(state, policy(state))
+    return state
@@ -0,0 +1,223 @@
+"""
+---------------------------------------------
+Project: Snake Game
+File Name: replay.py
+Created by: OverworldLord
+---------------------------------------------
+This program implements the 'Snake' game,
+       as described in README.md.
+---------------------------------------------
+PYLINT NOTES
+Code style checked with pylint, using the
+following:
+
+    pylint replay.py -d no-member
+---------------------------------------------
+This file records games and plays them back.
+A replay is the game's seed followed by every
+demon move and logic tick, with the time it
+happened and the direction the snake was
+given, so a game can be rerun exactly. Like
+engine.py nothing in here needs pygame, unless
+a replay is watched in the window. Classes
+are as follows:
+LatchedClock - Wraps a live clock so the time
+               the game sees only changes
+               between events.
+
+ReplayRecorder - Collects the events of a
+                 game as it's played and
+                 writes them to a file.
+
+Replay - A recorded game, which can be run
+         again on a fresh GameState.
+
+Run this file to play a replay back, either
+headless as fast as possible or in the
+window:
+
+    python replay.py replays/last.snr
+    python replay.py replays/last.snr --window
+---------------------------------------------
+"""
+
+#Used to pack replays into a compact binary file
+import struct
+
+#Used to pick seeds for new games
+import random as rng
+
+#Used to name and store replay files
+import os
+from datetime import datetime
+
+#Used to time headless playback and read the command line
+import time
+import argparse
+
+#Imports the simulation core
+from engine import INPUT
+from engine import GameState
+from engine import SimulatedClock
+from engine import Board
+from engine import move_demons
+from engine import update
+
+#Where the last game's replay is saved, and where long runs are kept
+REPLAY_DIR = 'replays'
+LAST_REPLAY = os.path.join(REPLAY_DIR, 'last.snr')
+
+#Runs that get at least this long are kept as well as being saved to LAST_REPLAY
+REPLAY_KEEP_LENGTH = 150
+
+#File layout: magic, format version, seed, the size of the demon swarm and whether it was
+#moved with NumPy, the board's columns and rows, then one event per demon move or tick,
+#then an end marker followed by the final score and length to check playback against
+REPLAY_MAGIC = b'SNKR'
+REPLAY_VERSION = 3
+HEADER = struct.Struct('<4sBQIBHH')
+EVENT = struct.Struct('<IB')
+RESULT = struct.Struct('<iI')
+
+#Event codes other than ticks, which store the value of the INPUT the snake was given
+DEMON_EVENT = 0xff
+END_EVENT = 0xfe
+
+def new_seed():
+    """ Picks the seed for a new game """
+    return rng.getrandbits(64)
+
+class LatchedClock():
+    """ Wraps a clock such as pygame.time, get_ticks only changes when latch is called
+        so the time an event is recorded at is the time the game saw """
+    def __init__(self, clock):
+        """ Class Constructor """
+        self.clock = clock
+        self.ticks = clock.get_ticks()
+    def latch(self):
+        """ Reads the wrapped clock, returns the new time in ms """
+        self.ticks = self.clock.get_ticks()
+        return self.ticks
+    def get_ticks(self):
+        """ Returns the time in ms as of the last latch """
+        return self.ticks
+
+class ReplayRecorder():
+    """ Records the events of a game as it's played """
+    def __init__(self, state):
+        """ Class Constructor, must be made before the state's first event """
+        self.seed = state.seed
+        self.demons = len(state.entities.demon)
+        self.vectorized = state.entities.demon.vectorized
+        self.board = state.board
+        self.start = state.clock.get_ticks()
+        self.events = bytearray()
+    def demon_moved(self, ticks):
+        """ Records the demon moving at the given time """
+        self.events += EVENT.pack(ticks - self.start, DEMON_EVENT)
+    def ticked(self, ticks, direction):
+        """ Records a logic tick at the given time, giving the snake direction """
+        self.events += EVENT.pack(ticks - self.start, direction.value)
+    def save(self, state, path=LAST_REPLAY):
+        """ Writes the replay to path, keeping a copy as well if the run was long """
+        paths = [path]
+        if len(state.snake) >= REPLAY_KEEP_LENGTH:
+            paths.append(os.path.join(REPLAY_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') +
+                                      '-%d.snr' % len(state.snake)))
+        data = (HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, self.demons,
+                            self.vectorized, self.board.columns, self.board.rows) +
+                self.events +
+                EVENT.pack(state.clock.get_ticks() - self.start, END_EVENT) +
+                RESULT.pack(state.ruleset.get_score(), len(state.snake)))
+        for out_path in paths:
+            if os.path.dirname(out_path):
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, 'wb') as out_file:
+                out_file.write(data)
+        return paths
+
+class Replay():
+    """ A recorded game, read from a replay file """
+    def __init__(self, path):
+        """ Class Constructor, raises ValueError if path isn't a replay """
+        with open(path, 'rb') as in_file:
+            data = in_file.read()
+        if len(data) < HEADER.size or data[:len(REPLAY_MAGIC)] != REPLAY_MAGIC:
+            raise ValueError('%s is not a replay' % path)
+        (_, version, self.seed, self.demons, self.vectorized,
+         columns, rows) = HEADER.unpack_from(data)
+        if version != REPLAY_VERSION:
+            raise ValueError('%s is replay version %d, expected %d' % (path, version,
+                                                                       REPLAY_VERSION))
+        self.vectorized = bool(self.vectorized)
+        self.board = Board(columns, rows)
+        #Every event as (time since the start, code), the final result if it was saved
+        self.events = []
+        self.result = None
+        for offset in range(HEADER.size, len(data) - EVENT.size + 1, EVENT.size):
+            ticks, code = EVENT.unpack_from(data, offset)
+            if code == END_EVENT:
+                self.length = ticks
+                self.result = RESULT.unpack_from(data, offset + EVENT.size)
+                break
+            self.events.append((ticks, code))
+        else:
+            #A game that was cut off is still played as far as it goes
+            self.length = self.events[-1][0] if self.events else 0
+    def new_state(self):
+        """ Returns a fresh GameState to play the replay on, with the same kind of swarm
+            it was recorded with. Raises ValueError if that needs NumPy and it's missing """
+        return GameState(self.seed, SimulatedClock(), self.demons, self.vectorized,
+                         self.board)
+    def playback(self, state):
+        """ Runs the replay's events on state one at a time, yielding the time each
+            happened at and whether anything on the board changed """
+        for ticks, code in self.events:
+            state.clock.advance_to(ticks)
+            if code == DEMON_EVENT:
+                move_demons(state)
+                yield ticks, True
+            else:
+                yield ticks, update(state, INPUT(code))
+    def play(self, state=None):
+        """ Runs the whole replay as fast as possible, returns the finished state """
+        if state is None:
+            state = self.new_state()
+        for _ in self.playback(state):
+            pass
+        return state
+    def matches(self, state):
+        """ Whether a played back state ended the same way as the recorded game """
+        return self.result is None or self.result == (state.ruleset.get_score(),
+                                                      len(state.snake))
+
+def main():
+    """ Plays back a replay file given on the command line """
+    parser = argparse.ArgumentParser(description='Play back a recorded game.')
+    parser.add_argument('path', nargs='?', default=LAST_REPLAY, help='replay file to play')
+    parser.add_argument('--window', action='store_true',
+                        help='watch the replay in the window at its recorded speed')
+    args = parser.parse_args()
+
+    replay = Replay(args.path)
+    if args.window:
+        #Only pull in pygame when the replay is actually going to be shown
+        import snake #pylint: disable=import-outside-toplevel
+        state = snake.watch_replay(replay)
+    else:
+        start = time.perf_counter()
+        state = replay.play()
+        elapsed = time.perf_counter() - start
+        print('Played %d events (%.1f s of game) in %.3f s' % (len(replay.events),
+                                                              replay.length/1000, elapsed))
+    print('Score %d, length %d, %d ticks' % (state.ruleset.get_score(), len(state.snake),
+                                             state.ticks))
+    if not replay.matches(state):
+        print('Playback does not match the recorded game, which ended with score %d, '
+              'length %d' % replay.result)
+        return 1
+    return 0
+
+#Call main
+if __name__ == "__main__":
+    raise SystemExit(main())
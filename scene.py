@@ -28,14 +28,41 @@ same line:
 Disabling this results in a rating of 10/10.
 ---------------------------------------------
 This file defines all classes used for the
-snake game. Classes are as follows:
-INPUT - Enumerator used for valid types of
-        input from the user.
+snake game that need pygame. INPUT, GameRules
+and NonPlayerEntityHandler are defined in
+engine.py and imported here, so they can
+still be imported from this file. Classes
+are as follows:
+LayerCache - Keeps pre-rendered surfaces,
+             such as the grid, around for
+             reuse.
+
+ScoreLog - Reads and appends runs to the
+           score log file.
+
+SqliteScoreStore - Keeps runs in an indexed
+                   database instead, and can
+                   query them by version and
+                   date.
 
 RunStats - Holds stats about a game instance
            and has functions to output those
            stats.
 
+FrameTimer - Times each stage of the game
+             loop, per frame for the HUD and
+             per logic tick for the CSV.
+
+GlitchNoise - Pre-generated random bytes the
+              glitch effects read from.
+
+Camera - The part of the board on screen,
+         which scrolls with the snake on
+         boards bigger than the screen.
+
+AssetManager - Loads and caches images for
+               the display.
+
 DisplayUpdater - Handles anything related to
                  the screen's display both
                  in the game itself and in
@@ -45,17 +72,8 @@ PlayerInput - Handles anything related to
               input from the player both in
               the game and in a menu.
 
-GameRules - Handles the logic behind the
-            game itself, including what
-            should happen if the snake eats
-            food, when they win or lose.
-
-NonPlayerEntityHandler - Handles the logic
-                         behind entities
-                         within the game,
-                         such as food or
-                         other things with
-                         a... peculiar AI.
+AudioCache - Keeps decoded copies of the
+             short sound effects on disk.
 
 AudioPlayer - Handles all audio in the game.
 ---------------------------------------------
@@ -70,116 +88,672 @@ from datetime import date as dt
 #Used for all random decisions
 import random as rng
 
-#Used for enumerator involving user input
-from enum import Enum
-
 #Used for file I/O
 import json
+import os
+
+#Used to keep cached layers in least recently used order
+from collections import OrderedDict
+from collections import deque
+
+#Used to keep the leaderboard's best scores
+import heapq
+
+#Used for the optional database of runs
+import sqlite3
 
 #Used to check python version
 import sys
 
+#Used to read music files in the background and save cached images in memory
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+#Used to name decoded sound effects cached on disk
+import hashlib
+
+#Used to time the stages of the game loop and write the timings out
+import time
+import csv
+from array import array
+
 #Used for display, sound, time, etc.
 import pygame
 
-class INPUT(Enum):
-    """Enumerator, used for getting user input"""
-    NONE = 0
-    LEFT = 1
-    UP = 2
-    RIGHT = 3
-    DOWN = 4
-    ENTER = 5
-    BACKSPACE = 6
-    SPACE = 7
-    ESCAPE = 8
-    C = 9
-
-#Minimum and maximum game speed in ms
-LOWER_BOUND, UPPER_BOUND = 100, 300
-
-#Size of the entire grid
-GRID_SIZE_X, GRID_SIZE_Y = 600, 600
+#The rules themselves live in engine.py so they can run without pygame
+from engine import INPUT
+from engine import GameRules
+from engine import NonPlayerEntityHandler
+from engine import Board
+from engine import GRID_SIZE_X
+from engine import GRID_SIZE_Y
+from engine import CELL_SIZE
 
-#Additional size of the Y axis below the grid
-MENU_SIZE = 50
+#How many times a second the game loop polls for input before sleeping
+POLL_RATE = 250
+
+#Whether the game redraws only the parts of the screen that changed
+INCREMENTAL_RENDERING = True
+
+#With incremental rendering, how many frames to patch up before a full redraw lets the
+#glitches show across the whole board
+GLITCH_REDRAW_FRAMES = 8
+
+#How many random bytes the glitch effects draw from before a fresh batch is made
+NOISE_TABLE_SIZE = 1 << 16
+
+#Out of every 65536 glitching segments, how many sit still in an orange band: 1 in 99
+ORANGE_BAND = 662
+
+#Colour of the snake
+SNAKE_COLOUR = (255, 255, 0)
+
+#Past this many demons, patching up every demon's area costs more than a full redraw
+DIRTY_REDRAW_DEMONS = 16
+
+#Size of the board in cells. Boards bigger than the screen scroll to follow the snake.
+BOARD_COLUMNS = GRID_SIZE_X // CELL_SIZE
+BOARD_ROWS = GRID_SIZE_Y // CELL_SIZE
+
+#How many pre-rendered grid layers and scores to keep around
+GRID_LAYERS_CACHED = 8
+SCORE_LAYERS_CACHED = 32
+
+#Colour used for the transparent parts of pre-rendered layers, never drawn by the game
+LAYER_COLORKEY = (255, 0, 255)
+
+#Keys that make a selection in the menus, and keys that turn the volume up (True) or down
+MENU_KEYS = {pygame.K_RETURN: INPUT.ENTER,
+             pygame.K_SPACE: INPUT.SPACE,
+             pygame.K_BACKSPACE: INPUT.BACKSPACE,
+             pygame.K_c: INPUT.C,
+             pygame.K_ESCAPE: INPUT.ESCAPE}
+VOLUME_KEYS = {pygame.K_z: False, pygame.K_x: True}
+
+#How long a volume key is held before it repeats, and how often it repeats, in ms
+VOLUME_REPEAT_DELAY = 400
+VOLUME_REPEAT_INTERVAL = 100
+
+#Keys that steer the snake
+MOVEMENT_KEYS = {pygame.K_a: INPUT.LEFT, pygame.K_LEFT: INPUT.LEFT,
+                 pygame.K_w: INPUT.UP, pygame.K_UP: INPUT.UP,
+                 pygame.K_d: INPUT.RIGHT, pygame.K_RIGHT: INPUT.RIGHT,
+                 pygame.K_s: INPUT.DOWN, pygame.K_DOWN: INPUT.DOWN}
+
+#Most turns held for upcoming ticks, extra presses are dropped
+MOVEMENT_BUFFER_SIZE = 3
 
-#Size of every cell on the grid
-CELL_SIZE = 24
+#How many recent input-to-move latencies are kept for measurement
+LATENCY_SAMPLES = 256
 
-#Amount of fat the snake should start with
-STARTING_FAT = 0
+#How often to recheck held keys while waiting for them to be let go, in ms
+MENU_POLL = 100
 
-#Whether or not to make things impossibly difficult
-IMPOSSIBLE_MODE = False
+#How many recent frames of stage timings are kept for the HUD, and the stages of the game
+#loop being timed
+FRAME_SAMPLES = 1024
+FRAME_STAGES = ('input', 'demons', 'rules', 'audio', 'redraw')
 
-#Number of demons to spawn
-DEMONS_TO_SPAWN = 1 + 99*IMPOSSIBLE_MODE
+#Key that shows and hides the frame timing HUD, whether it starts shown, and how often it
+#updates in ms
+HUD_KEY = pygame.K_F3
+SHOW_HUD = False
+HUD_REFRESH = 250
+
+#Key that hands the snake over to the autopilot and back, and whether it starts on
+AUTOPILOT_KEY = pygame.K_F2
+USE_AUTOPILOT = False
+
+#Where the timings of every logic tick of the last game are written, None to not write
+#them
+FRAME_TIMES_FILE = 'db/frame_times.csv'
+
+#Additional size of the Y axis below the grid
+MENU_SIZE = 50
 
 #Game's current version, used for leaderboards
 GAME_VERSION = "1.0 Release"
 
+#Where every run is logged, and the file runs were kept in before the log
+SCORE_LOG = 'db/scores.jsonl'
+OLD_SCORE_FILE = 'db/scores.json'
+
+#Index of the best scores in the log, and how many scores the leaderboard shows
+LEADERBOARD_INDEX = 'db/leaderboard.json'
+LEADERBOARD_SIZE = 5
+
+#Where runs are kept: 'log' for the score log, 'sqlite' for an indexed database
+SCORE_BACKEND = 'log'
+SCORE_DATABASE = 'db/scores.sqlite3'
+
+#Only show scores from this version of the game on the leaderboard, None for all
+LEADERBOARD_VERSION = None
+
+#Where scaled copies of images are kept, and the size full screen images are drawn at
+ASSET_CACHE_DIR = 'cache'
+SCREEN_IMAGE_SIZE = (GRID_SIZE_X, GRID_SIZE_X + MENU_SIZE)
+
+#Music for each phase of the game, and the snake length each phase lasts until
+PHASE_TRACKS = ("ogg/SnakeP1.ogg", "ogg/SnakeP1B1.ogg", "ogg/SnakeP2B2.ogg",
+                "ogg/SnakeP2B2H1.ogg", "ogg/SnakeP2B2H1D1.ogg", "ogg/SnakeP2B2H1D1G1.ogg")
+PHASE_LENGTHS = (20, 50, 80, 120, 160)
+
+#Where decoded sound effects are kept
+AUDIO_CACHE_DIR = 'cache/audio'
+
+#Posted when the music ending a game finishes, and how often to check on it anyway
+MUSIC_END_EVENT = pygame.USEREVENT + 1
+STING_POLL = 100
+
 #Default audio volumes
 MUSIC_VOLUME = .05
 EFFECT_VOLUME = .1
 
+def write_atomically(path, data):
+    """ Writes data, bytes or text, to path under a temporary name first and then moves
+        it into place, so a crash can't leave half a file behind """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w' if isinstance(data, str) else 'wb') as out_file:
+        out_file.write(data)
+    os.replace(temp_path, path)
+
+class ScoreLog():
+    """ Append-only log of every run, one JSON record per line """
+    def __init__(self, path=SCORE_LOG, old_path=OLD_SCORE_FILE, index_path=LEADERBOARD_INDEX):
+        """ Class Constructor, moves runs over from the old score file the first time """
+        self.path = path
+        self.old_path = old_path
+        self.index_path = index_path
+        #The leaderboard as last read, along with the file sizes and times it was read at
+        self.cached_scores = []
+        self.cached_key = None
+        self.migrate()
+        self.repair()
+    def repair(self):
+        """ Ends a line cut short by a crash, so the next run doesn't get glued onto it """
+        try:
+            with open(self.path, 'rb+') as log_file:
+                log_file.seek(0, os.SEEK_END)
+                if log_file.tell() == 0:
+                    return
+                log_file.seek(-1, os.SEEK_END)
+                if log_file.read(1) != b'\n':
+                    log_file.write(b'\n')
+        except FileNotFoundError:
+            return
+    def migrate(self):
+        """ Copies runs from the old JSON array file into the log, if there's no log yet """
+        if os.path.exists(self.path) or not os.path.exists(self.old_path):
+            return
+        try:
+            with open(self.old_path, 'r') as score_file:
+                datalist = json.loads(score_file.read())
+        except json.decoder.JSONDecodeError:
+            datalist = []
+
+        write_atomically(self.path, ''.join(json.dumps(run_info) + '\n'
+                                            for run_info in datalist))
+    def append(self, run_info):
+        """ Adds a run to the end of the log with a single write """
+        line = (json.dumps(run_info) + '\n').encode('utf-8')
+        log_file = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(log_file, line)
+        finally:
+            os.close(log_file)
+        #Bring the leaderboard up to date with the run that's just been added
+        self.cached_key = None
+        self.top_scores()
+    def runs(self, offset=0):
+        """ Yields (run, end offset) for every complete run in the log after the byte
+            offset given, skipping a line cut short by a crash or a run without a score """
+        try:
+            with open(self.path, 'rb') as log_file:
+                log_file.seek(offset)
+                for line in log_file:
+                    #A line without an end is still being written, leave it for next time
+                    if not line.endswith(b'\n'):
+                        return
+                    offset += len(line)
+                    try:
+                        run_info = json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        continue
+                    #A hand-edited or old record might not have a score to rank it by
+                    if (not isinstance(run_info, dict) or
+                            not isinstance(run_info.get('score'), (int, float))):
+                        continue
+                    yield run_info, offset
+        except FileNotFoundError:
+            return
+    def top_scores(self, version=None):
+        """ Returns the best LEADERBOARD_SIZE scores, highest first, optionally only for
+            one version of the game """
+        #The index covers every version, picking out one means reading the whole log
+        if version is not None:
+            return heapq.nlargest(LEADERBOARD_SIZE, (run_info['score'] for run_info, _
+                                                     in self.runs()
+                                                     if run_info.get('version') == version))
+        #Only touch the disk if the index or the log have changed since the last look
+        key = (self.file_key(self.index_path), self.file_key(self.path))
+        if key != self.cached_key:
+            self.cached_scores = self.update_index()
+            self.cached_key = (self.file_key(self.index_path), self.file_key(self.path))
+        return self.cached_scores
+    def update_index(self):
+        """ Loads the leaderboard index, adds any runs logged since it was saved and
+            returns the best scores, highest first """
+        try:
+            with open(self.index_path, 'r') as index_file:
+                index = json.loads(index_file.read())
+            offset, heap = index['offset'], index['scores']
+        except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError, TypeError):
+            offset, heap = 0, []
+
+        #If the log has shrunk it's been replaced, so start from the beginning
+        log_size = self.file_key(self.path)[0]
+        if log_size < offset:
+            offset, heap = 0, []
+
+        #Keep a min-heap of the best scores, so each run costs at most log(N) to add
+        heapq.heapify(heap)
+        new_offset = offset
+        for run_info, new_offset in self.runs(offset):
+            if len(heap) < LEADERBOARD_SIZE:
+                heapq.heappush(heap, run_info['score'])
+            else:
+                heapq.heappushpop(heap, run_info['score'])
+
+        if new_offset != offset or not os.path.exists(self.index_path):
+            write_atomically(self.index_path, json.dumps({'offset': new_offset,
+                                                          'scores': heap}))
+        return sorted(heap, reverse=True)
+    def file_key(self, path):
+        """ Returns the size and modification time of a file, (0, 0) if it doesn't exist """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_size, stat.st_mtime_ns
+
+class SqliteScoreStore():
+    """ Keeps every run in an indexed SQLite database, an alternative to ScoreLog """
+    def __init__(self, path=SCORE_DATABASE, log_path=SCORE_LOG):
+        """ Class Constructor, copies runs over from the score log the first time """
+        #Several games can write at once, each waits its turn rather than failing
+        self.connection = sqlite3.connect(path, timeout=10)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS runs ('
+                                    'id INTEGER PRIMARY KEY, '
+                                    'score INTEGER NOT NULL, '
+                                    'version TEXT NOT NULL, '
+                                    'date TEXT NOT NULL, '
+                                    'time_played REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS runs_by_score '
+                                    'ON runs (score DESC)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS runs_by_version '
+                                    'ON runs (version, score DESC)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS runs_by_date '
+                                    'ON runs (date, score DESC)')
+        self.migrate(log_path)
+    def __del__(self):
+        self.connection.close()
+    def migrate(self, log_path):
+        """ Copies every run from the score log, if the database is empty """
+        if self.connection.execute('SELECT 1 FROM runs LIMIT 1').fetchone():
+            return
+        rows = [self.run_row(run_info) for run_info, _ in ScoreLog(log_path).runs()]
+        #Check again holding the write lock, so two games starting together can't both
+        #find the table empty and import the log twice
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            if self.connection.execute('SELECT 1 FROM runs LIMIT 1').fetchone():
+                return
+            self.connection.executemany('INSERT INTO runs (score, version, date, time_played) '
+                                        'VALUES (?, ?, ?, ?)', rows)
+    def run_row(self, run_info):
+        """ Converts a run as RunStats records it to a row of the runs table """
+        return (int(run_info['score']),
+                run_info.get('version', ''),
+                run_info.get('date', ''),
+                float(run_info.get('time played', 0)))
+    def append(self, run_info):
+        """ Adds a run to the database """
+        with self.connection:
+            self.connection.execute('INSERT INTO runs (score, version, date, time_played) '
+                                    'VALUES (?, ?, ?, ?)', self.run_row(run_info))
+    def top_scores(self, version=None, limit=LEADERBOARD_SIZE):
+        """ Returns the best scores, highest first, optionally only for one version """
+        if version is None:
+            rows = self.connection.execute('SELECT score FROM runs '
+                                           'ORDER BY score DESC LIMIT ?', (limit,))
+        else:
+            rows = self.connection.execute('SELECT score FROM runs WHERE version = ? '
+                                           'ORDER BY score DESC LIMIT ?', (version, limit))
+        return [score for score, in rows]
+    def daily_bests(self, version=None):
+        """ Returns (date, best score) for every day a run was played, oldest first """
+        if version is None:
+            rows = self.connection.execute('SELECT date, MAX(score) FROM runs '
+                                           'GROUP BY date ORDER BY date')
+        else:
+            rows = self.connection.execute('SELECT date, MAX(score) FROM runs '
+                                           'WHERE version = ? GROUP BY date ORDER BY date',
+                                           (version,))
+        return rows.fetchall()
+    def time_played(self, version=None):
+        """ Returns the number of runs and the total, average and longest time played
+            in seconds, optionally only for one version """
+        if version is None:
+            rows = self.connection.execute('SELECT COUNT(*), TOTAL(time_played), '
+                                           'AVG(time_played), MAX(time_played) FROM runs')
+        else:
+            rows = self.connection.execute('SELECT COUNT(*), TOTAL(time_played), '
+                                           'AVG(time_played), MAX(time_played) FROM runs '
+                                           'WHERE version = ?', (version,))
+        count, total, average, longest = rows.fetchone()
+        return {'runs': count, 'total': total, 'average': average or 0,
+                'longest': longest or 0}
+
 class RunStats():
     """ Holds stats about the current run, to be output to a file """
-    def __init__(self):
+    def __init__(self, score_log=None):
         self.run_date = dt.today()
         self.run_start = pygame.time.get_ticks()
         self.run_end = pygame.time.get_ticks()
+        self.score_log = score_log if score_log is not None else ScoreLog()
     def output_to_file(self, score):
-        """ Outputs data to the output file, separated by | """
+        """ Outputs data to the end of the score log """
         self.run_end = pygame.time.get_ticks()
         run_info = {'score': score,
                     'version': GAME_VERSION,
                     'date': str(self.run_date),
                     'time played': str((self.run_end - self.run_start)/1000)}
-        try:
-            with open('db/scores.json', 'r') as score_file:
-                data = score_file.read()
-            datalist = json.loads(data)
-        except json.decoder.JSONDecodeError:
-            datalist = []
-
-        datalist.append(run_info)
-        output = json.dumps(datalist)
-        with open('db/scores.json', 'w') as score_file:
-            score_file.write(output)
+        self.score_log.append(run_info)
+    def output_frame_times(self, frame_timer, path=FRAME_TIMES_FILE):
+        """ Writes the timings of every logic tick of the run as CSV """
+        if path is None:
+            return
+        with open(path, 'w', newline='') as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(('tick', 'frames', 'frame ms') +
+                            tuple(stage + ' ms' for stage in FRAME_STAGES))
+            writer.writerows(frame_timer.rows())
     def print_to_console(self, score):
         """ Outputs data to the console """
         print("Total Score:", score)
         print("Date of Run:", self.run_date)
         print("Total Time Played (Seconds):", int((self.run_end - self.run_start)/1000))
 
+class FrameTimer():
+    """ Times each stage of the game loop in ms, keeping the last few frames in fixed
+        size arrays for the HUD so timing a frame never allocates. The frames of each
+        logic tick are also added up into one entry per tick, kept for the whole run
+        so they can be written out once the game is over """
+    def __init__(self, size=FRAME_SAMPLES):
+        """ Class Constructor """
+        self.size = size
+        self.stages = {stage: array('d', bytes(8*size)) for stage in FRAME_STAGES}
+        self.frame_times = array('d', bytes(8*size))
+        self.ticks = array('l', bytes(array('l').itemsize*size))
+        #Frames timed so far, the slot the current frame goes in and when it started
+        self.count = 0
+        self.slot = 0
+        self.frame_start = self.stage_start = time.perf_counter()
+        #Every tick finished so far: its number, how many frames it took and the total
+        #time of those frames and of each stage, as floats to keep long runs small
+        self.tick_numbers = array('l')
+        self.tick_frames = array('l')
+        self.tick_times = array('f')
+        self.tick_stages = {stage: array('f') for stage in FRAME_STAGES}
+        #The same totals for the tick still going on, None until a frame has been timed
+        self.tick = None
+        self.frames_this_tick = 0
+        self.totals = array('d', bytes(8*(len(FRAME_STAGES) + 1)))
+    def start_frame(self):
+        """ Starts timing a frame, after the loop has finished sleeping """
+        self.slot = self.count % self.size
+        for times in self.stages.values():
+            times[self.slot] = 0
+        self.frame_start = self.stage_start = time.perf_counter()
+    def mark(self, stage):
+        """ Adds the time since the last mark (or the start of the frame) to stage """
+        now = time.perf_counter()
+        self.stages[stage][self.slot] += (now - self.stage_start)*1000
+        self.stage_start = now
+    def end_frame(self, tick):
+        """ Finishes timing a frame, which happened during the given logic tick """
+        self.frame_times[self.slot] = (time.perf_counter() - self.frame_start)*1000
+        self.ticks[self.slot] = tick
+        self.count += 1
+        if tick != self.tick:
+            self.end_tick()
+            self.tick = tick
+        self.frames_this_tick += 1
+        self.totals[0] += self.frame_times[self.slot]
+        for index, stage in enumerate(FRAME_STAGES, 1):
+            self.totals[index] += self.stages[stage][self.slot]
+    def end_tick(self):
+        """ Adds the totals of the tick going on to the run's ticks and starts new ones """
+        if self.tick is None:
+            return
+        self.tick_numbers.append(self.tick)
+        self.tick_frames.append(self.frames_this_tick)
+        self.tick_times.append(self.totals[0])
+        for index, stage in enumerate(FRAME_STAGES, 1):
+            self.tick_stages[stage].append(self.totals[index])
+            self.totals[index] = 0
+        self.totals[0] = 0
+        self.frames_this_tick = 0
+        self.tick = None
+    def percentile(self, fraction):
+        """ Returns the frame time that fraction of the kept frames were faster than """
+        if not self.count:
+            return 0
+        times = sorted(self.frame_times[:min(self.count, self.size)])
+        return times[min(len(times) - 1, int(fraction*len(times)))]
+    def hud_text(self):
+        """ Returns the lines shown on the HUD: the last frame's time, the p50 and p99
+            frame times and the last frame's time in each stage """
+        last = (self.count - 1) % self.size
+        return ('frame %.2f p50 %.2f p99 %.2f ms' % (self.frame_times[last],
+                                                     self.percentile(.5),
+                                                     self.percentile(.99)),
+                ' '.join('%s %.2f' % (stage[:2], self.stages[stage][last])
+                         for stage in FRAME_STAGES))
+    def rows(self):
+        """ Yields (tick, frames, frame ms, ms in each stage) for every tick of the run,
+            the times being the totals over the tick's frames """
+        self.end_tick()
+        for index, tick in enumerate(self.tick_numbers):
+            yield ((tick, self.tick_frames[index], round(self.tick_times[index], 3)) +
+                   tuple(round(self.tick_stages[stage][index], 3) for stage in FRAME_STAGES))
+
+class GlitchNoise():
+    """ A table of random bytes for the glitch effects, so a frame makes one slice
+        rather than a random call for every value. A new table is made once the old one
+        has been used up, so values never repeat """
+    def __init__(self, size=NOISE_TABLE_SIZE, rand=rng):
+        """ Class Constructor """
+        self.size = size
+        self.rand = rand
+        self.table = b''
+        self.offset = size
+    def take(self, count):
+        """ Returns count random bytes, each 0 to 255 """
+        if self.offset + count > len(self.table):
+            #One swarm can need more than a whole table in a frame
+            self.table = self.rand.getrandbits(8*max(self.size, count)).to_bytes(
+                max(self.size, count), 'little')
+            self.offset = 0
+        self.offset += count
+        return self.table[self.offset - count:self.offset]
+
+class Camera():
+    """ The part of the board shown on screen. On boards too big for the screen it
+        keeps the snake's head in the middle, and only what's in view is drawn """
+    def __init__(self, board, width=GRID_SIZE_X, height=GRID_SIZE_Y):
+        """ Class Constructor """
+        self.board = board
+        self.width = width
+        self.height = height
+        #Top left of the view on the board, always on a cell boundary
+        self.x = 0
+        self.y = 0
+        self.scrolls = board.width > width or board.height > height
+    def follow(self, head):
+        """ Moves the view so head is in the middle, as far as the board allows """
+        if self.scrolls:
+            self.x = max(0, min(self.board.width - self.width,
+                                head[0] - (self.width//2 - self.width//2 % CELL_SIZE)))
+            self.y = max(0, min(self.board.height - self.height,
+                                head[1] - (self.height//2 - self.height//2 % CELL_SIZE)))
+    def sees(self, pos):
+        """ Whether the cell at the (x, y) position pos is in view """
+        return (self.x <= pos[0] < self.x + self.width and
+                self.y <= pos[1] < self.y + self.height)
+    def visible_snake(self, snake):
+        """ Returns the on screen position of every segment in view. Long snakes are
+            found by looking through the cells in view, so it never costs more than the
+            screen has cells """
+        if not self.scrolls:
+            return snake
+        if len(snake) < (self.width//CELL_SIZE)*(self.height//CELL_SIZE):
+            return [(seg_x - self.x, seg_y - self.y) for seg_x, seg_y in snake
+                    if self.sees((seg_x, seg_y))]
+        occupancy = snake.occupancy
+        first_col = self.x//CELL_SIZE
+        last_col = min(occupancy.columns, (self.x + self.width)//CELL_SIZE)
+        segments = []
+        for row in range(self.y//CELL_SIZE, min(occupancy.rows,
+                                                (self.y + self.height)//CELL_SIZE)):
+            start = row*occupancy.columns
+            seg_y = row*CELL_SIZE - self.y
+            segments.extend((col*CELL_SIZE - self.x, seg_y) for col, cell
+                            in enumerate(occupancy.cells[start + first_col:start + last_col],
+                                         first_col)
+                            if cell & occupancy.SNAKE)
+        return segments
+    def visible_food(self, food):
+        """ Returns the on screen position of every food item in view """
+        if not self.scrolls:
+            return food
+        return [(food_x - self.x, food_y - self.y) for food_x, food_y in food
+                if self.sees((food_x, food_y))]
+    def on_screen(self, pos):
+        """ Returns where the (x, y) position pos on the board is on screen """
+        return pos[0] - self.x, pos[1] - self.y
+    def grid_offset(self):
+        """ Returns how far the grid's pattern, which repeats every two cells, is shifted
+            in view, or None if the board doesn't scroll """
+        if not self.scrolls:
+            return None
+        return self.x % (2*CELL_SIZE), self.y % (2*CELL_SIZE)
+
+class LayerCache():
+    """ Keeps pre-rendered surfaces, throwing out the least recently used ones """
+    def __init__(self, render, size):
+        """ Class Constructor, render(key) draws the surface for a key that isn't cached """
+        self.render = render
+        self.size = size
+        self.surfaces = OrderedDict()
+    def get(self, key):
+        """ Returns the surface for key, rendering it if needed """
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+        surface = self.render(key)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+class AssetManager():
+    """ Loads images the first time they're needed, keeping scaled and converted copies
+        both in memory and on disk """
+    def __init__(self, cache_dir=ASSET_CACHE_DIR):
+        """ Class Constructor, nothing is loaded until it's asked for """
+        self.cache_dir = cache_dir
+        self.images = {}
+    def image(self, path, size):
+        """ Returns the image at path scaled to size and converted for the screen """
+        if (path, size) not in self.images:
+            self.images[(path, size)] = self.load_image(path, size)
+        return self.images[(path, size)]
+    def load_image(self, path, size):
+        """ Loads an image from the disk cache, or scales the original and caches it """
+        cache_path = self.cache_path(path, size)
+        try:
+            surface = pygame.image.load(cache_path)
+        except (pygame.error, FileNotFoundError):
+            surface = pygame.transform.scale(pygame.image.load(path), size)
+            self.save_to_cache(surface, cache_path)
+        #Blits are much cheaper once the image is in the same pixel format as the screen
+        return surface.convert()
+    def cache_path(self, path, size):
+        """ Returns where the cached copy of an image lives. The name changes whenever the
+            original image does, or the size it's scaled to """
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, '%s-%dx%d-%d.bmp' % (name, size[0], size[1],
+                                                                  os.stat(path).st_mtime_ns))
+    def save_to_cache(self, surface, cache_path):
+        """ Writes a scaled image to the cache, replacing older copies of it """
+        prefix = os.path.basename(cache_path).rsplit('-', 1)[0] + '-'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for old_file in os.listdir(self.cache_dir):
+                if old_file.startswith(prefix):
+                    os.remove(os.path.join(self.cache_dir, old_file))
+            image = io.BytesIO()
+            pygame.image.save(surface, image, 'bmp')
+            write_atomically(cache_path, image.getvalue())
+        except (pygame.error, OSError):
+            #Without a cache the image is just scaled again next time
+            return
+
 class DisplayUpdater():
     """ Holds functions that will be used to create and update the display """
-    def __init__(self):
-        """Load required visual assets"""
-        #Load death image
-        self.image = pygame.image.load("img/spookdestroy.jpg")
-        self.image = pygame.transform.scale(self.image,
-                                            (GRID_SIZE_X, GRID_SIZE_X + MENU_SIZE))
-        #Load main menu
-        self.main_menu = pygame.image.load("img/main_menu.jpg")
-        self.main_menu = pygame.transform.scale(self.main_menu,
-                                                (GRID_SIZE_X, GRID_SIZE_X + MENU_SIZE))
-        #Load leaderboard
-        self.leaderboard = pygame.image.load("img/leaderboard.jpg")
-        self.leaderboard = pygame.transform.scale(self.leaderboard,
-                                                  (GRID_SIZE_X, GRID_SIZE_X + MENU_SIZE))
-        #Load credits
-        self.credits = pygame.image.load("img/credits.jpg")
-        self.credits = pygame.transform.scale(self.credits,
-                                              (GRID_SIZE_X, GRID_SIZE_X + MENU_SIZE))
+    def __init__(self, incremental=INCREMENTAL_RENDERING):
+        """Load required visual assets, incremental sets whether redraw() may repaint
+           only the parts of the screen that changed"""
         #Load screen
         self.screen = pygame.display.set_mode((GRID_SIZE_X, GRID_SIZE_Y + MENU_SIZE))
 
-        #Load all fonts
-        spooky_font = pygame.font.SysFont('javanesetext', CELL_SIZE*4)
-        self.spooky_font = spooky_font.render('NO ESCAPE', False, (0, 0, 0))
+        #Images (death, main menu, leaderboard, credits) are loaded the first time they
+        #are shown, already scaled and converted to the screen's format
+        self.assets = AssetManager()
+
+        #Load all fonts. The spooky font means searching the system's fonts, so it waits
+        #until it's needed
+        self.spooky_font = None
         self.score_font = pygame.font.Font('font/upheavtt.ttf', int(MENU_SIZE/2))
+
+        #Where the leaderboard comes from
+        if SCORE_BACKEND == 'sqlite':
+            self.score_log = SqliteScoreStore()
+        else:
+            self.score_log = ScoreLog()
+
+        #Pre-rendered layers: the grid for each colour, the digits for each score
+        self.grid_layers = LayerCache(self.render_grid, GRID_LAYERS_CACHED)
+        self.score_layers = LayerCache(self.render_score, SCORE_LAYERS_CACHED)
+
+        #What was drawn last frame, used to work out which parts of the screen changed
+        self.incremental = incremental
+        self.last_frame = None
+
+        #The part of the board in view
+        self.camera = Camera(Board())
+
+        #Random values for the glitch effects, and the tiles glitching segments are drawn as
+        self.noise = GlitchNoise()
+        self.band_tiles = self.render_band_tiles()
+
+        #Lines of frame timings shown in the score bar, None when the HUD is hidden
+        self.hud_lines = None
+        self.hud_changed = False
+        self.hud_font = None
     def __del__(self):
         pygame.display.quit()
     def generate_display(self):
@@ -189,7 +763,10 @@ class DisplayUpdater():
     def show_image(self):
         """ displays an image to the screen """
         self.screen.fill((255, 0, 0))
-        self.screen.blit(self.image, (0, 0))
+        if self.spooky_font is None:
+            spooky_font = pygame.font.SysFont('javanesetext', CELL_SIZE*4)
+            self.spooky_font = spooky_font.render('NO ESCAPE', False, (0, 0, 0))
+        self.screen.blit(self.assets.image("img/spookdestroy.jpg", SCREEN_IMAGE_SIZE), (0, 0))
         self.screen.blit(self.spooky_font,
                          (GRID_SIZE_X - int(GRID_SIZE_X/1.2),
                           (GRID_SIZE_Y)))
@@ -197,37 +774,19 @@ class DisplayUpdater():
     def show_main_menu(self):
         """ displays the main menu to the user """
         self.screen.fill((0, 0, 0))
-        self.screen.blit(self.main_menu, (0, 0))
+        self.screen.blit(self.assets.image("img/main_menu.jpg", SCREEN_IMAGE_SIZE), (0, 0))
         pygame.display.update()
     def show_leaderboard(self):
         """ displays the leaderboard to the user """
         self.screen.fill((0, 0, 0))
-        self.screen.blit(self.leaderboard, (0, 0))
+        self.screen.blit(self.assets.image("img/leaderboard.jpg", SCREEN_IMAGE_SIZE), (0, 0))
         display_scores = []
-        try:
-            with open('db/scores.json', 'r') as score_file:
-                data = score_file.read()
-            datalist = json.loads(data)
-            scores = []
-            for elem in datalist:
-                scores.append(elem['score'])
-            scores.sort(reverse=True)
-            if len(scores) >= 1:
-                display_scores.append(self.score_font.render(str(scores[0]),
-                                                             False, (139, 69, 19)))
-            if len(scores) >= 2:
-                display_scores.append(self.score_font.render(str(scores[1]),
-                                                             False, (139, 69, 19)))
-            if len(scores) >= 3:
-                display_scores.append(self.score_font.render(str(scores[2]),
+        scores = self.score_log.top_scores(LEADERBOARD_VERSION)
+        if scores:
+            for score in scores:
+                display_scores.append(self.score_font.render(str(score),
                                                              False, (139, 69, 19)))
-            if len(scores) >= 4:
-                display_scores.append(self.score_font.render(str(scores[3]),
-                                                             False, (139, 69, 19)))
-            if len(scores) >= 5:
-                display_scores.append(self.score_font.render(str(scores[4]),
-                                                             False, (139, 69, 19)))
-        except json.decoder.JSONDecodeError:
+        else:
             display_scores.append(self.score_font.render("Press ENTER",
                                                          False, (139, 69, 19)))
             display_scores.append(self.score_font.render("to play and",
@@ -243,15 +802,29 @@ class DisplayUpdater():
     def show_credits(self):
         """ Shows the user the credits screen """
         self.screen.fill((0, 0, 0))
-        self.screen.blit(self.credits, (0, 0))
+        self.screen.blit(self.assets.image("img/credits.jpg", SCREEN_IMAGE_SIZE), (0, 0))
         pygame.display.update()
+    def set_board(self, board):
+        """ Sets the board the game's played on, scrolling the view if it's too big """
+        self.camera = Camera(board)
+        self.last_frame = None
     def redraw(self, snake, food, demon, score):
+        """redraws the display within the game, only repainting what changed if it can"""
+        self.camera.follow(snake.head())
+        if (self.incremental and len(demon) <= DIRTY_REDRAW_DEMONS and
+                self.can_redraw_dirty(snake)):
+            self.redraw_dirty(snake, food, demon, score)
+        else:
+            self.redraw_full(snake, food, demon, score)
+    def redraw_full(self, snake, food, demon, score):
         """redraws the display within the game from scratch"""
 
         #Fill the screen with the background
-        self.screen.fill((int(len(snake) / 10),
-                          min(100, rng.randrange(0, 1 + int(len(snake)/10))),
-                          min(100, rng.randrange(0, 1 + int(len(snake)/10)))))
+        noise = self.noise.take(2)
+        background = (min(255, int(len(snake) / 10)),
+                      min(100, noise[0]*(1 + int(len(snake)/10)) >> 8),
+                      min(100, noise[1]*(1 + int(len(snake)/10)) >> 8))
+        self.screen.fill(background)
         #Draw the snake
         self.draw_snake(snake)
         #Draw the food
@@ -264,6 +837,106 @@ class DisplayUpdater():
         self.draw_score(score)
 
         pygame.display.update()
+        self.remember_frame(snake, food, demon, score, background)
+    def can_redraw_dirty(self, snake):
+        """ Whether the last frame can be patched up rather than drawn from scratch """
+        last = self.last_frame
+        #Nothing to patch up if this is a new game, or if the view keeps scrolling
+        if last is None or last['snake'] is not snake or self.camera.scrolls:
+            return False
+        #The grid and background change colour as the snake grows
+        if self.shade(snake) != last['shade']:
+            return False
+        #Glitches affect the whole snake, so let them show every few frames
+        if len(snake) > 80 and last['frames'] >= GLITCH_REDRAW_FRAMES:
+            return False
+        #The snake can only be followed if it has moved at most one cell
+        if snake.head() != last['head'] and (len(snake) < 2 or snake[1] != last['head']):
+            return False
+        return len(snake) - last['length'] in (0, 1)
+    def redraw_dirty(self, snake, food, demon, score):
+        """ Repaints only the cells that changed since the last frame """
+        last = self.last_frame
+        board = pygame.Rect(0, 0, GRID_SIZE_X, GRID_SIZE_Y)
+        score_area = pygame.Rect(0, GRID_SIZE_Y, GRID_SIZE_X, MENU_SIZE)
+        dirty = []
+
+        #A new head and a vacated tail
+        if snake.head() != last['head']:
+            dirty.append(self.cell_area(snake.head()))
+        if snake[-1] != last['tail']:
+            dirty.append(self.cell_area(last['tail']))
+        #Food that's been eaten and food that's been spawned
+        food_cells = [tuple(food_item) for food_item in food]
+        if food_cells != last['food']:
+            dirty.extend(self.cell_area(food_item) for food_item in last['food'] + food_cells)
+        #Everywhere the demons were and are now
+        demon_areas = [self.demon_area(indiv_demon) for indiv_demon in demon]
+        dirty.extend(last['demon_areas'] + demon_areas)
+
+        #Repaint everything under the dirty parts of the board
+        dirty = [area.clip(board) for area in dirty if area.colliderect(board)]
+        for area in dirty:
+            self.repaint_area(area, snake, food, last['background'])
+        self.draw_demon(demon, snake)
+
+        #The score bar only needs redrawing if the score or HUD changed or a demon was over it
+        if (score != last['score'] or self.hud_changed or
+                any(area.colliderect(score_area) for area in demon_areas + last['demon_areas'])):
+            self.screen.fill(last['background'], score_area)
+            self.draw_score(score)
+            dirty.append(score_area)
+
+        pygame.display.update(dirty)
+        self.remember_frame(snake, food, demon, score, last['background'], last['frames'] + 1)
+    def repaint_area(self, area, snake, food, background):
+        """ Draws the background, snake, food and grid inside one area of the board """
+        self.screen.set_clip(area)
+        self.screen.fill(background, area)
+        #Segments can be drawn a little outside of their cell, so check a cell further out
+        first_x = max(0, area.left//CELL_SIZE - 1)
+        last_x = min(GRID_SIZE_X//CELL_SIZE - 1, (area.right - 1)//CELL_SIZE + 1)
+        first_y = max(0, area.top//CELL_SIZE - 1)
+        last_y = min(GRID_SIZE_Y//CELL_SIZE - 1, (area.bottom - 1)//CELL_SIZE + 1)
+        for cell_y in range(first_y, last_y + 1):
+            for cell_x in range(first_x, last_x + 1):
+                body_segment = (cell_x*CELL_SIZE, cell_y*CELL_SIZE)
+                if snake.occupancy.snake_at(body_segment):
+                    self.draw_segment(body_segment, len(snake))
+        self.draw_food(snake, food)
+        self.draw_grid(snake, area)
+        self.screen.set_clip(None)
+    def remember_frame(self, snake, food, demon, score, background, frames=0):
+        """ Keeps track of what's on screen so the next frame can be drawn incrementally """
+        #Big swarms are always drawn from scratch, so there's no need to track them
+        demon_areas = []
+        if len(demon) <= DIRTY_REDRAW_DEMONS:
+            demon_areas = [self.demon_area(indiv_demon) for indiv_demon in demon]
+        self.last_frame = {'snake': snake,
+                           'head': snake.head(),
+                           'tail': snake[-1],
+                           'length': len(snake),
+                           'food': [tuple(food_item) for food_item in food],
+                           'demon_areas': demon_areas,
+                           'score': score,
+                           'shade': self.shade(snake),
+                           'background': background,
+                           'frames': frames}
+    def shade(self, snake):
+        """ Returns the parts of the board's colours that depend on the snake's length """
+        return int(len(snake) / 10), min(255, int(len(snake) / 2))
+    def cell_area(self, pos):
+        """ Returns the area a snake segment or food in the cell at pos can be drawn in """
+        return pygame.Rect(pos[0], pos[1], CELL_SIZE, CELL_SIZE).inflate(2*CELL_SIZE,
+                                                                          2*CELL_SIZE)
+    def demon_area(self, indiv_demon):
+        """ Returns the area a demon can draw over, including the cells it corrupts """
+        demon_x, demon_y = indiv_demon
+        corruption = pygame.Rect(demon_x - (demon_x % CELL_SIZE) - 2*CELL_SIZE,
+                                 demon_y - (demon_y % CELL_SIZE) - 2*CELL_SIZE,
+                                 4*CELL_SIZE, 4*CELL_SIZE)
+        circles = pygame.Rect(int(demon_x) - 26, int(demon_y) - 26, 52, 52)
+        return corruption.union(circles)
     def draw_snake(self, snake):
         """ Draws the snake to the screen"""
         #Prints every segment of the snake. Traditionally, this was in a nested for loop that
@@ -271,20 +944,50 @@ class DisplayUpdater():
         #Previous complexity: GRID_SIZE_X*GRID_SIZE_X*len(snake)/CELL_SIZE^2
         #Current complexity:  len(snake)
 
-        #Draw the snake if it is present
-        for body_segment in snake:
-            seg_x, seg_y = body_segment
-            if len(snake) > 80 and rng.randrange(1, 100) == 50:
-                rect = pygame.Rect(seg_x, seg_y, CELL_SIZE, CELL_SIZE)
-                pygame.draw.rect(self.screen, (255, rng.randrange(120, 180), 0), rect)
-            elif len(snake) > 80:
-                rect = pygame.Rect(seg_x + min(rng.randrange(-2, 2)*(len(snake) - 80)/80, 10),
-                                   seg_y + min(rng.randrange(-2, 2)*(len(snake) - 80)/80, 10),
-                                   CELL_SIZE, CELL_SIZE)
-                pygame.draw.rect(self.screen, (255, rng.randrange(120, 180), 0), rect)
-            else:
-                rect = pygame.Rect(seg_x, seg_y, CELL_SIZE, CELL_SIZE)
-                pygame.draw.rect(self.screen, (255, 255, 0), rect)
+        #Draw the snake if it is present, as much of it as is in view
+        length = len(snake)
+        segments = self.camera.visible_snake(snake)
+        if length <= 80:
+            for seg_x, seg_y in segments:
+                pygame.draw.rect(self.screen, SNAKE_COLOUR, (seg_x, seg_y, CELL_SIZE, CELL_SIZE))
+            return
+
+        #Long snakes glitch, so every segment is a pre-rendered tile in one of the band's
+        #colours and the whole body goes out in a single blits call. The noise for every
+        #segment is fetched at once: two bytes to pick whether it's in a band, the low one
+        #also picking how far across it shakes, one for how far down it shakes and one for
+        #its colour.
+        noise = self.noise.take(4*len(segments))
+        shake = [min(((value & 3) - 2)*(length - 80)/80, 10) for value in range(0, 4)]
+        tiles = self.band_tiles
+        self.screen.blits([(tiles[colour],
+                            (seg_x, seg_y) if (high << 8 | low) < ORANGE_BAND else
+                            (int(seg_x + shake[low & 3]), int(seg_y + shake[down & 3])))
+                           for (seg_x, seg_y), high, low, down, colour
+                           in zip(segments, noise[0::4], noise[1::4], noise[2::4],
+                                  noise[3::4])], False)
+    def draw_segment(self, body_segment, length):
+        """ Draws a single segment of a snake of the given length """
+        seg_x, seg_y = body_segment
+        if length <= 80:
+            pygame.draw.rect(self.screen, SNAKE_COLOUR, (seg_x, seg_y, CELL_SIZE, CELL_SIZE))
+            return
+        high, low, down, colour = self.noise.take(4)
+        #A segment is in an orange band 1 time in 99, the rest shake around
+        if (high << 8 | low) >= ORANGE_BAND:
+            shake = (length - 80)/80
+            seg_x = int(seg_x + min(((low & 3) - 2)*shake, 10))
+            seg_y = int(seg_y + min(((down & 3) - 2)*shake, 10))
+        self.screen.blit(self.band_tiles[colour], (seg_x, seg_y))
+    def render_band_tiles(self):
+        """ Renders a tile for every shade a glitching segment can be, returned as a list
+            indexed by the byte of noise that picks the shade """
+        shades = []
+        for green in range(120, 180):
+            tile = pygame.Surface((CELL_SIZE, CELL_SIZE)).convert()
+            tile.fill((255, green, 0))
+            shades.append(tile)
+        return [shades[value*60 >> 8] for value in range(0, 256)]
     def draw_food(self, snake, food):
         """" Draws food to the screen """
         #Prints food. Traditionally, this was in a nested for loop that
@@ -292,95 +995,158 @@ class DisplayUpdater():
         #Previous complexity: GRID_SIZE_X*GRID_SIZE_X*len(food)/CELL_SIZE^2
         #Current complexity:  len(food)
 
-        #Get the position of the food
-        for food_item in food:
+        #Get the position of the food in view
+        for food_item in self.camera.visible_food(food):
             food_x, food_y = food_item
             if len(snake) > 100:
-                rectsize = rng.randrange(0, int(CELL_SIZE/2))
-                rect = pygame.Rect(food_x + rng.randrange(-5, 5),
-                                   food_y + rng.randrange(-5, 5),
+                noise = self.noise.take(6)
+                rectsize = noise[0]*int(CELL_SIZE/2) >> 8
+                rect = pygame.Rect(food_x - 5 + (noise[1]*10 >> 8),
+                                   food_y - 5 + (noise[2]*10 >> 8),
                                    CELL_SIZE - rectsize,
                                    CELL_SIZE - rectsize)
                 pygame.draw.rect(self.screen,
-                                 (rng.randrange(100, 255),
-                                  rng.randrange(100, 255),
-                                  rng.randrange(100, 255)),
+                                 (100 + (noise[3]*155 >> 8),
+                                  100 + (noise[4]*155 >> 8),
+                                  100 + (noise[5]*155 >> 8)),
                                  rect)
             else:
                 rect = pygame.Rect(food_x, food_y, CELL_SIZE, CELL_SIZE)
                 pygame.draw.rect(self.screen, (255, 255, 255), rect)
-    def draw_grid(self, snake):
-        """ Draws the grid to the screen """
+    def draw_grid(self, snake, area=None):
+        """ Draws the grid to the screen, or only the part inside area if given """
+        #The grid only changes colour as the snake grows, so it is drawn once per colour
+        #and blitted from then on.
+        #Previous number of prints:         (GRID_SIZE_X + GRID_SIZE_Y) / (2 * CELL_SIZE)
+        #Current number of prints required: 1
+        if area is None:
+            area = pygame.Rect(0, 0, GRID_SIZE_X, GRID_SIZE_Y)
+        self.screen.blit(self.grid_layers.get((min(255, int(len(snake) / 2)),
+                                               self.camera.grid_offset())), area, area)
+    def render_grid(self, key):
+        """ Renders the grid onto a transparent layer. key is the shade of green and how
+            far the view has shifted the grid, None if the whole board is on screen """
+        green, offset = key
+        layer = pygame.Surface((GRID_SIZE_X, GRID_SIZE_Y)).convert()
+        layer.fill(LAYER_COLORKEY)
         #Prints every cell; in actuality, prints a rectangle for every other x and y cell
         #that makes up the grid. This method is highly efficient compared to the previous
         #version, which printed every cell individually.
         #Previous number of prints:         (GRID_SIZE_X * GRID_SIZE_Y) / CELL_SIZE ^ 2
         #Current number of prints required: (GRID_SIZE_X + GRID_SIZE_Y) / (2 * CELL_SIZE)
 
+        #A scrolling view doesn't show the edges of the board, so the rectangles are
+        #shifted along with the view and run a cell off of every side of the screen
+        first_col, first_row, outside = 0, 0, 0
+        if offset is not None:
+            first_col, first_row, outside = -offset[0], -offset[1], CELL_SIZE
+
         #Prints every column in the grid for cells
-        for col in range(0, GRID_SIZE_X, 2*CELL_SIZE):
-            rect = pygame.Rect(col, 0, CELL_SIZE, GRID_SIZE_Y)
-            pygame.draw.rect(self.screen, (0, min(255, int(len(snake) / 2)), 0), rect, 1)
+        for col in range(first_col, GRID_SIZE_X, 2*CELL_SIZE):
+            rect = pygame.Rect(col, -outside, CELL_SIZE, GRID_SIZE_Y + 2*outside)
+            pygame.draw.rect(layer, (0, green, 0), rect, 1)
         #Prints every row in the grid for cells
-        for row in range(0, GRID_SIZE_Y, 2*CELL_SIZE):
-            rect = pygame.Rect(0, row, GRID_SIZE_X, CELL_SIZE)
-            pygame.draw.rect(self.screen, (0, min(255, int(len(snake) / 2)), 0), rect, 1)
+        for row in range(first_row, GRID_SIZE_Y, 2*CELL_SIZE):
+            rect = pygame.Rect(-outside, row, GRID_SIZE_X + 2*outside, CELL_SIZE)
+            pygame.draw.rect(layer, (0, green, 0), rect, 1)
+        #Run-length encoded once drawn, so a blit skips over the transparent runs rather
+        #than checking every pixel
+        layer.set_colorkey(LAYER_COLORKEY, pygame.RLEACCEL)
+        return layer
     def draw_demon(self, demon, snake):
         """ Draws the demon to the screen, while modifying cells near the demon """
         #Corrupts cells near the demon. Previously, this checked all cells to see if the
         #demon was in their bounds.
         #Previous Complexity: GRID_SIZE_X*GRID_SIZE_X*len(food)/CELL_SIZE^2
         #Current Complexity: 4*4 = 16
-        head_x, head_y = snake[0]
-        for indiv_demon in demon:
-            demon_x, demon_y = indiv_demon
+        head_x, head_y = self.camera.on_screen(snake.head())
+        #Only demons close enough to the view to draw on it are drawn
+        reach = 3*CELL_SIZE
+        view_x, view_y = self.camera.x, self.camera.y
+        for indiv_demon in demon.within(view_x - reach, view_y - reach,
+                                        view_x + GRID_SIZE_X + reach,
+                                        view_y + GRID_SIZE_Y + MENU_SIZE + reach):
+            demon_x, demon_y = indiv_demon = self.camera.on_screen(indiv_demon)
+            #16 bytes of noise for the corruption, 6 for the circles, 5 for the spark
+            noise = self.noise.take(27)
 
             #Add chance to corrupt the cell if it is near the demon
             cell_under_demon_x = demon_x - (demon_x % CELL_SIZE)
             cell_under_demon_y = demon_y - (demon_y % CELL_SIZE)
 
-            #Corrupt cells near the demon
-            for cell_near_demon_x in range(-2*CELL_SIZE, 2*CELL_SIZE, CELL_SIZE):
-                for cell_near_demon_y in range(-2*CELL_SIZE, 2*CELL_SIZE, CELL_SIZE):
-                    if rng.randrange(0, 25) == 0:
-                        rect = pygame.Rect(cell_near_demon_x + cell_under_demon_x,
-                                           cell_near_demon_y + cell_under_demon_y,
-                                           CELL_SIZE, CELL_SIZE)
-                        pygame.draw.rect(self.screen, (0, 0, 0), rect)
+            #Corrupt cells near the demon, each about 1 time in 25
+            for near_cell in range(0, 16):
+                if noise[near_cell] < 10:
+                    rect = pygame.Rect(cell_under_demon_x + (near_cell//4 - 2)*CELL_SIZE,
+                                       cell_under_demon_y + (near_cell % 4 - 2)*CELL_SIZE,
+                                       CELL_SIZE, CELL_SIZE)
+                    pygame.draw.rect(self.screen, (0, 0, 0), rect)
 
             #Draws the demon. No change from previous iteration.
 
             #Draw the demon's outer and inner circles
             pygame.draw.circle(self.screen,
-                               (rng.randrange(0, 255),
-                                rng.randrange(0, 55),
-                                rng.randrange(0, 55)),
+                               (noise[16]*255 >> 8,
+                                noise[17]*55 >> 8,
+                                noise[18]*55 >> 8),
                                indiv_demon, 25, 5)
             pygame.draw.circle(self.screen,
-                               (rng.randrange(0, 255),
-                                rng.randrange(0, 55),
-                                rng.randrange(0, 55)),
+                               (noise[19]*255 >> 8,
+                                noise[20]*55 >> 8,
+                                noise[21]*55 >> 8),
                                indiv_demon, 20, 5)
 
             if abs(demon_x - head_x)/CELL_SIZE < 2 and abs(demon_y - head_y)/CELL_SIZE < 2:
                 pygame.draw.circle(self.screen,
-                                   (rng.randrange(0, 255),
-                                    rng.randrange(0, 100),
-                                    rng.randrange(0, 100)),
-                                   (demon_x + rng.randrange(-7, 7),
-                                    demon_y + rng.randrange(-7, 7)), 6)
+                                   (noise[22]*255 >> 8,
+                                    noise[23]*100 >> 8,
+                                    noise[24]*100 >> 8),
+                                   (demon_x - 7 + (noise[25]*14 >> 8),
+                                    demon_y - 7 + (noise[26]*14 >> 8)), 6)
     def draw_score(self, score):
         """Draws the user's current score to the screen in the menu"""
         rect = pygame.Rect(0, GRID_SIZE_Y, GRID_SIZE_X, MENU_SIZE)
         pygame.draw.rect(self.screen, (0, 0, 255), rect, int(MENU_SIZE/10))
-        out_score = self.score_font.render(str(score), False, (255, 255, 255))
-        self.screen.blit(out_score, (GRID_SIZE_X/2 - CELL_SIZE,
-                                     (GRID_SIZE_Y + int(MENU_SIZE*1/10))))
+        self.screen.blit(self.score_layers.get(score), (GRID_SIZE_X/2 - CELL_SIZE,
+                                                        GRID_SIZE_Y + int(MENU_SIZE*1/10)))
+        if self.hud_lines is not None:
+            self.draw_hud()
+        self.hud_changed = False
+    def set_hud(self, lines):
+        """ Sets the lines shown on the HUD, or hides it if lines is None """
+        if lines != self.hud_lines:
+            self.hud_lines = lines
+            self.hud_changed = True
+    def draw_hud(self):
+        """ Draws the HUD's lines on the left of the score bar """
+        if self.hud_font is None:
+            self.hud_font = pygame.font.Font('font/upheavtt.ttf', int(MENU_SIZE/4))
+        line_y = GRID_SIZE_Y + int(MENU_SIZE/10) + 1
+        for line in self.hud_lines:
+            self.screen.blit(self.hud_font.render(line, False, (255, 255, 255)),
+                             (int(MENU_SIZE/10) + 2, line_y))
+            line_y += self.hud_font.get_linesize()
+    def render_score(self, score):
+        """ Renders the score's digits onto a transparent layer just big enough for them.
+            The border around the score bar is cheaper to draw than to blit """
+        layer = self.score_font.render(str(score), False, (255, 255, 255),
+                                       LAYER_COLORKEY).convert()
+        layer.set_colorkey(LAYER_COLORKEY, pygame.RLEACCEL)
+        return layer
 class PlayerInput():
     """ Used in order to get and respond to player inputs/interactions """
     def __init__(self):
         pygame.event.get()
         self.pressed = pygame.key.get_pressed()
+        #Turns waiting for a logic tick as (direction, time pressed), and recent latencies
+        self.turns = deque()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        #Whether the frame timing HUD is shown during the game
+        self.show_hud = SHOW_HUD
+        #Whether the autopilot is steering instead of the player
+        self.autopilot = USE_AUTOPILOT
+        #Whether the player has closed the window
+        self.quit = False
         if sys.version_info[1] < 7:
             print("  Please use python 3.7+. Using python 3.6 or below")
             print("  will cause the game to crash as soon as a sound")
@@ -388,204 +1154,111 @@ class PlayerInput():
         else:
             print("Welcome to snake!")
     def clear_menu_input(self):
-        """ Checks whether the player is not pressing anything """
-        user_pressing_button = True
-        while user_pressing_button:
-            pygame.event.get()
+        """ Waits until the player is not pressing anything, sleeping between key events """
+        pygame.event.pump()
+        self.pressed = pygame.key.get_pressed()
+        while any(self.pressed[key] for key in list(MENU_KEYS) + list(VOLUME_KEYS)):
+            pygame.event.wait(MENU_POLL)
             self.pressed = pygame.key.get_pressed()
-            user_pressing_button = (self.pressed[pygame.K_RETURN] or self.pressed[pygame.K_SPACE] or
-                                    self.pressed[pygame.K_BACKSPACE] or self.pressed[pygame.K_c] or
-                                    self.pressed[pygame.K_ESCAPE] or self.pressed[pygame.K_z] or
-                                    self.pressed[pygame.K_x])
+        #Anything pressed while the keys were held has already been dealt with
+        pygame.event.clear((pygame.KEYDOWN, pygame.KEYUP))
     def get_menu_input(self, sound):
-        """ Gets input from the main menu"""
+        """ Gets input from the main menu, sleeping until a key is pressed """
         user_input = INPUT.NONE
+        #The volume key being held down, and when it should next repeat
+        held_key = None
+        repeat_time = 0
         while user_input == INPUT.NONE:
-            pygame.event.get()
-            self.pressed = pygame.key.get_pressed()
-            if self.pressed[pygame.K_RETURN]:
-                user_input = INPUT.ENTER
-            elif self.pressed[pygame.K_SPACE]:
-                user_input = INPUT.SPACE
-            elif self.pressed[pygame.K_BACKSPACE]:
-                user_input = INPUT.BACKSPACE
-            elif self.pressed[pygame.K_c]:
-                user_input = INPUT.C
-            elif self.pressed[pygame.K_ESCAPE]:
-                user_input = INPUT.ESCAPE
-            elif self.pressed[pygame.K_z]:
-                sound.change_volume(False)
-                self.clear_menu_input()
-            elif self.pressed[pygame.K_x]:
-                sound.change_volume(True)
-                self.clear_menu_input()
+            if held_key is None:
+                event = pygame.event.wait()
+            else:
+                event = pygame.event.wait(max(1, repeat_time - pygame.time.get_ticks()))
+
+            if event.type == pygame.KEYDOWN and event.key in MENU_KEYS:
+                user_input = MENU_KEYS[event.key]
+            elif event.type == pygame.KEYDOWN and event.key in VOLUME_KEYS:
+                sound.change_volume(VOLUME_KEYS[event.key])
+                held_key = event.key
+                repeat_time = pygame.time.get_ticks() + VOLUME_REPEAT_DELAY
+            elif event.type == pygame.KEYUP and event.key == held_key:
+                held_key = None
+            elif held_key is not None and pygame.time.get_ticks() >= repeat_time:
+                #Keep changing the volume for as long as the key is held
+                sound.change_volume(VOLUME_KEYS[held_key])
+                repeat_time = pygame.time.get_ticks() + VOLUME_REPEAT_INTERVAL
         self.clear_menu_input()
         if user_input != INPUT.NONE:
             sound.play_menu_select()
         return user_input
-    def get_movement(self):
-        """gets a movement signal from the player"""
-        pygame.event.get()
-        self.pressed = pygame.key.get_pressed()
-
+    def reset_movement(self):
+        """ Forgets any buffered turns, ready for a new game """
+        pygame.event.clear((pygame.KEYDOWN, pygame.KEYUP))
+        self.turns.clear()
+        self.latencies.clear()
+    def poll_movement(self):
+        """ Buffers the turns pressed since the last poll along with when they were
+            pressed, returns INPUT.ESCAPE if the player wants to quit """
         user_input = INPUT.NONE
-        if self.pressed[pygame.K_a] or self.pressed[pygame.K_LEFT]:
-            user_input = INPUT.LEFT
-        elif self.pressed[pygame.K_w] or self.pressed[pygame.K_UP]:
-            user_input = INPUT.UP
-        elif self.pressed[pygame.K_d] or self.pressed[pygame.K_RIGHT]:
-            user_input = INPUT.RIGHT
-        elif self.pressed[pygame.K_s] or self.pressed[pygame.K_DOWN]:
-            user_input = INPUT.DOWN
-        elif self.pressed[pygame.K_ESCAPE]:
-            user_input = INPUT.ESCAPE
+        now = pygame.time.get_ticks()
+        for event in pygame.event.get():
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_ESCAPE:
+                user_input = INPUT.ESCAPE
+            elif event.key == HUD_KEY:
+                self.show_hud = not self.show_hud
+            elif event.key == AUTOPILOT_KEY:
+                self.autopilot = not self.autopilot
+            elif event.key in MOVEMENT_KEYS:
+                direction = MOVEMENT_KEYS[event.key]
+                #Pressing the same way twice in a row doesn't turn twice
+                if ((not self.turns or self.turns[-1][0] != direction) and
+                        len(self.turns) < MOVEMENT_BUFFER_SIZE):
+                    self.turns.append((direction, now))
         return user_input
-
-class GameRules():
-    """ Holds game rules, determines what should happen upon game interaction """
-    def __init__(self):
-        self.score = 0
-        self.fat = STARTING_FAT
-    def add_to_score(self, score):
-        """ add points to our score """
-        self.score += score
-    def get_score(self):
-        """ return our current score """
-        return self.score
-    def player_eats_food(self, snake, food):
-        """Check whether the player is currently eating food, add fat and return true if so"""
-        head = snake[0]
-        head_x, head_y = head
-        for food_item in food:
-            food_x, food_y = food_item
-            #Return whether or not the player's received food, adds fat if they have
-            if head_x == food_x and head_y == food_y:
-                #We've eaten food, update our score
-                self.score += int(150 + int(len(snake)/10)*5)
-
-                #Add more fat to the user if they already have some or they have a decent score
-                self.fat += 8 + int(self.fat/4) + int(self.score/500)
-                return True
-        return False
-
-    def player_loss(self, snake, demon):
-        """Checks if the player has lost, returns true if so"""
-        #Get the snake's head, as well as the rest of its body
-        head = snake[0]
-        body = snake[1:]
-
-        #Get the head's x and y location
-        head_x, head_y = head
-
-        #If the head has moved out of bounds, we've lost
-        if head_x < 0 or head_x >= GRID_SIZE_X or head_y < 0 or head_y >= GRID_SIZE_Y:
-            return True
-
-        #If the head has hit the body, we've lost
-        for body_segment in body:
-            if head == body_segment:
-                return True
-
-        #If the demon's too close to the head
-        for indiv_demon in demon:
-            demon_x, demon_y = indiv_demon
-            if (head_x < demon_x < head_x + CELL_SIZE and
-                head_y < demon_y < head_y + CELL_SIZE):
-                return True
-
-        #Since none of the above conditions have applied, we haven't lost yet
-        return False
-    def player_win(self, snake):
-        """ whether the player has met a win condition """
-        return len(snake) >= GRID_SIZE_X/CELL_SIZE*GRID_SIZE_Y/CELL_SIZE - 1
-    def player_burn_fat(self):
-        """ burns fat from the snake """
-        #If the player has fat, burn it and make them grow
-        if self.fat > 0:
-            #Slightly increase our score counter
-            self.score += int(int(self.fat/5)*5 + 20)
-            self.fat -= 1
-            return True
-        return False
-
-class NonPlayerEntityHandler():
-    """ Handles all non-player entities (food, demon) """
-    def __init__(self, snake):
+    def get_movement(self, direction=INPUT.NONE):
+        """ Gets the next buffered turn for a snake heading in direction, or INPUT.NONE.
+            Gives at most one turn per call so quick turns are made on following ticks """
+        while self.turns:
+            turn, pressed_time = self.turns.popleft()
+            if turn != direction:
+                self.latencies.append(pygame.time.get_ticks() - pressed_time)
+                return turn
+        return INPUT.NONE
+    def input_latency(self):
+        """ Returns the mean and worst time in ms between a turn being pressed and the
+            snake moving that way, over the recent turns """
+        if not self.latencies:
+            return 0, 0
+        return sum(self.latencies)/len(self.latencies), max(self.latencies)
+
+class AudioCache():
+    """ Decodes short sounds once into raw PCM files, which later runs load instead """
+    def __init__(self, cache_dir=AUDIO_CACHE_DIR):
         """ Class Constructor """
-        self.set_food_position(snake)
-        self.demon = []
-        for indiv_demon in range(0, DEMONS_TO_SPAWN):
-            demon_x = -50 + (GRID_SIZE_X + 100)*rng.randrange(0, 2)
-            demon_y = -50 + 10*indiv_demon + (GRID_SIZE_Y + 100)*rng.randrange(0, 2)
-            self.demon.append([demon_x, demon_y])
-    def set_food_position(self, snake):
-        """ Moves the food to a new board location """
-        valid_position = False
-        self.pos = []
-
-        #While the food is within the snake
-        food_item = 0
-        while food_item in range(0, 1 + int(len(snake)/80)):
-            while(not valid_position and
-                  len(snake) < (GRID_SIZE_X*GRID_SIZE_Y)/CELL_SIZE - (1 + int(len(snake)/80))):
-                #Set a new position for the food
-                food_x = rng.randrange(0, GRID_SIZE_X, CELL_SIZE)
-                food_y = rng.randrange(0, GRID_SIZE_Y, CELL_SIZE)
-                valid_position = True
-
-                #Check if the new position is in the snake
-                for body_segment in snake:
-                    seg_x, seg_y = body_segment
-                    if seg_x == food_x and seg_y == food_y:
-                        valid_position = False
-            food_item += 1
-            valid_position = False
-            self.pos.append([food_x, food_y])
-    def demon_active(self, snake):
-        """ Checks and returns whether or not the demon is active """
-        #Return whether or not the demon should be active
-        return len(snake) > 50
-    def set_demon_position(self, snake):
-        """ Sets the demon's current position """
-        #Only move the demon if the snake is long enough
-        if self.demon_active(snake):
-            #Get snake's x and y values
-            head = snake[0]
-            head_x, head_y = head
-            for demon_index in range(0, len(self.demon)):
-                #Get demon's x and y values
-                demon_x, demon_y = self.demon[demon_index]
-
-                #Set amount to move in x, y
-                move_x = rng.randrange(2, int(len(snake) / 12))
-                move_y = rng.randrange(2, int(len(snake) / 12))
-
-                if abs(demon_x - head_x) > abs(demon_y - head_y):
-                    move_x /= 2
-                    move_y += 2*IMPOSSIBLE_MODE
-                else:
-                    move_x += 2*IMPOSSIBLE_MODE
-                    move_y /= 2
-
-                #Move closer to the player in the x INPUTection
-                if head_x + CELL_SIZE/2 > demon_x:
-                    demon_x += move_x
-                else:
-                    demon_x -= move_x
-
-                #Move closer to the player in the y INPUTection
-                if head_y + CELL_SIZE/2 > demon_y:
-                    demon_y += move_y
-                else:
-                    demon_y -= move_y
-
-                self.demon[demon_index] = [demon_x, demon_y]
-    def get_demon_position(self):
-        """ Gets the demon's current position """
-        return self.demon
-    def get_food_position(self):
-        """ Gets the food's current position """
-        return self.pos
+        self.cache_dir = cache_dir
+    def cache_path(self, path):
+        """ Returns where the decoded copy of a sound lives. It's named after the sound's
+            contents and the mixer's format, so an edited file is decoded again """
+        with open(path, 'rb') as sound_file:
+            digest = hashlib.sha1(sound_file.read()).hexdigest()
+        frequency, size, channels = pygame.mixer.get_init()
+        return os.path.join(self.cache_dir, '%s-%d-%d-%d.pcm' % (digest, frequency, size,
+                                                                 channels))
+    def pcm(self, path):
+        """ Returns the decoded samples of a sound, decoding the sound into the cache
+            first if needed """
+        cache_path = self.cache_path(path)
+        if not os.path.exists(cache_path):
+            samples = pygame.mixer.Sound(path).get_raw()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_atomically(cache_path, samples)
+            return samples
+        with open(cache_path, 'rb') as cache_file:
+            return cache_file.read()
+    def sound(self, path):
+        """ Returns a Sound made from the cached samples of path, which pygame copies """
+        return pygame.mixer.Sound(buffer=self.pcm(path))
 
 class AudioPlayer():
     """ Handles all audio functionality """
@@ -598,11 +1271,15 @@ class AudioPlayer():
         self.effect_volume = EFFECT_VOLUME
         self.music_volume = MUSIC_VOLUME
 
+        #Sound effects are short, so they're decoded once and kept on disk. Music is far
+        #too big to hold decoded and streams through pygame.mixer.music instead
+        self.audio_cache = AudioCache()
+
         #Load menu, food, entity sounds
-        self.menu_select = pygame.mixer.Sound("wav/MenuSelect.wav")
-        self.passive_food_collected = pygame.mixer.Sound("wav/FoodCollectPassive.wav")
-        self.hunting_food_collected = pygame.mixer.Sound("wav/FoodCollectHunting.wav")
-        self.demon_move = pygame.mixer.Sound("wav/DemonMove.wav")
+        self.menu_select = self.audio_cache.sound("wav/MenuSelect.wav")
+        self.passive_food_collected = self.audio_cache.sound("wav/FoodCollectPassive.wav")
+        self.hunting_food_collected = self.audio_cache.sound("wav/FoodCollectHunting.wav")
+        self.demon_move = self.audio_cache.sound("wav/DemonMove.wav")
 
         #Set audio volumes for the previously loaded sounds and music
         pygame.mixer.music.set_volume(self.music_volume)
@@ -611,8 +1288,61 @@ class AudioPlayer():
         self.hunting_food_collected.set_volume(self.effect_volume)
         self.demon_move.set_volume(.4*self.effect_volume)
 
+        #Music is read into memory on a background thread ahead of when it's needed, so
+        #the game never waits on the disk to change tracks
+        self.loader = ThreadPoolExecutor(max_workers=1)
+        self.prefetched = {}
+        for filename in PHASE_TRACKS:
+            self.prefetch(filename)
+
+        #The phase track lined up to play when the current one ends, and how far into
+        #the current track we were last time we checked
+        self.queued = None
+        self.last_position = 0
+
+        #Whether the music that ends a game is playing
+        self.sting = False
+
         #Set the filename of the first music file
         self.filename = "ogg/SnakeP1.ogg"
+    def prefetch(self, filename):
+        """ Starts reading a music file into memory in the background """
+        if filename not in self.prefetched:
+            self.prefetched[filename] = self.loader.submit(self.read_music, filename)
+    def read_music(self, filename):
+        """ Returns the contents of a music file, run on the loader thread """
+        with open(filename, 'rb') as music_file:
+            return music_file.read()
+    def music_source(self, filename, wait=False):
+        """ Returns something pygame.mixer.music can play filename from: the prefetched
+            data if it's ready (or wait is set), otherwise None """
+        self.prefetch(filename)
+        future = self.prefetched[filename]
+        if not wait and not future.done():
+            return None
+        try:
+            return io.BytesIO(future.result())
+        except OSError:
+            #Let pygame report the problem with the file itself
+            return filename
+    def load_music(self, filename):
+        """ Loads a music file, from memory if it has been prefetched. The mixer tells
+            the format from the data itself, so no name hint is given, which pygame
+            2.0.1 doesn't take """
+        pygame.mixer.music.load(self.music_source(filename, wait=True))
+        self.queued = None
+        self.last_position = 0
+    def play_music(self, filename, loops=0):
+        """ Starts streaming a music file """
+        pygame.mixer.music.set_volume(self.music_volume)
+        self.load_music(filename)
+        pygame.mixer.music.play(loops=loops)
+    def phase_track(self, length):
+        """ Returns the music that goes with a snake of the given length """
+        for phase_end, filename in zip(PHASE_LENGTHS, PHASE_TRACKS):
+            if length < phase_end:
+                return filename
+        return PHASE_TRACKS[-1]
     def change_volume(self, increase):
         """ Updates volume based on user input """
         if increase:
@@ -650,52 +1380,73 @@ class AudioPlayer():
         else:
             self.filename = "ogg/SnakeHuntFood.ogg"
         #Load the music and start playing it
-        pygame.mixer.music.load(self.filename)
-        pygame.mixer.music.play(loops=-1)
+        self.play_music(self.filename, loops=-1)
     def play_menu_select(self):
         """ Replays a sound when selecting something on the main menu """
         self.menu_select.stop()
         self.menu_select.play()
     def play_alive(self, snake):
         """ Play a different song depending on the current 'phase' """
+        #Play specific music based on how long the snake is
+        phase = self.phase_track(len(snake))
         if(self.filename == "ogg/SnakeHuntJinnMini.ogg" or
            self.filename == "ogg/SnakeHuntFood.ogg" or not
            pygame.mixer.music.get_busy()):
-            #Play specific music based on how long the snake is
-            if len(snake) < 20:
-                self.filename = "ogg/SnakeP1.ogg"
-            elif len(snake) < 50:
-                self.filename = "ogg/SnakeP1B1.ogg"
-            elif len(snake) < 80:
-                self.filename = "ogg/SnakeP2B2.ogg"
-            elif len(snake) < 120:
-                self.filename = "ogg/SnakeP2B2H1.ogg"
-            elif len(snake) < 160:
-                self.filename = "ogg/SnakeP2B2H1D1.ogg"
-            else:
-                self.filename = "ogg/SnakeP2B2H1D1G1.ogg"
-            pygame.mixer.music.set_volume(self.music_volume)
-            pygame.mixer.music.load(self.filename)
-            pygame.mixer.music.play()
+            self.filename = phase
+            self.play_music(self.filename)
+        else:
+            #The position goes back to zero when the queued track takes over
+            position = pygame.mixer.music.get_pos()
+            if position < self.last_position and self.queued is not None:
+                self.filename = self.queued
+                self.queued = None
+            self.last_position = position
+
+            #Line up the track for the current phase to start the moment this one ends.
+            #Queueing again replaces the old one, so the phase can change mid-track
+            if self.queued != phase:
+                source = self.music_source(phase)
+                if isinstance(source, io.BytesIO):
+                    pygame.mixer.music.queue(source)
+                    self.queued = phase
+
+        #The snake only grows, so the next phase's track is the one to have ready
+        next_phase = PHASE_TRACKS.index(phase) + 1
+        if next_phase < len(PHASE_TRACKS):
+            self.prefetch(PHASE_TRACKS[next_phase])
     def play_dead(self, snake):
-        """ Play a sound if the player is dying """
+        """ Play a sound if the player is dying, without waiting for it to end """
         #Play different music depending on if the snake has encountered the boss
         if len(snake) < 50:
             self.filename = "ogg/SnakeLoss.ogg"
         else:
             self.filename = "ogg/SnakeDeath.ogg"
-        pygame.mixer.music.load(self.filename)
-        pygame.mixer.music.play()
-
-        #wait for the music to end before stopping the game
-        while pygame.mixer.music.get_busy():
-            self.filename = "HELP"
+        self.play_sting(self.filename)
     def play_win(self):
-        """ Plays a sound upon winning the game """
+        """ Plays a sound upon winning the game, without waiting for it to end """
         #Play a noise if you somehow, SOMEHOW, win the game
         self.filename = "ogg/SnakeVictory.ogg"
-        pygame.mixer.music.load(self.filename)
-        pygame.mixer.music.play()
-        #wait for the music to end before stopping the game
-        while pygame.mixer.music.get_busy():
-            self.filename = "HELP"
+        self.play_sting(self.filename)
+    def play_sting(self, filename):
+        """ Plays the music that ends a game, posting MUSIC_END_EVENT when it's over """
+        self.play_music(filename)
+        pygame.mixer.music.set_endevent(MUSIC_END_EVENT)
+        self.sting = True
+    def sting_playing(self):
+        """ Whether the music ending the game is still going """
+        #In case the end event was missed, the music stopping also ends the sting
+        if self.sting and not pygame.mixer.music.get_busy():
+            self.end_sting()
+        return self.sting
+    def handle_event(self, event):
+        """ Responds to an event from the main loop """
+        if event.type == MUSIC_END_EVENT:
+            self.end_sting()
+    def end_sting(self):
+        """ Marks the music ending the game as over """
+        pygame.mixer.music.set_endevent()
+        self.sting = False
+    def stop_sting(self):
+        """ Cuts the music ending the game short """
+        self.end_sting()
+        pygame.mixer.music.stop()
@@ -31,15 +31,30 @@ from scene import RunStats
 from scene import DisplayUpdater
 from scene import AudioPlayer
 from scene import PlayerInput
-from scene import GameRules
-from scene import NonPlayerEntityHandler
-
-#Imports the required constants from scene (not all are required)
-from scene import GRID_SIZE_X
-from scene import GRID_SIZE_Y
-from scene import CELL_SIZE
-from scene import UPPER_BOUND
-from scene import LOWER_BOUND
+from scene import FrameTimer
+
+#Imports the pygame-free simulation core
+from engine import GameState
+from engine import tick_length
+from engine import move_demons
+from engine import update
+from engine import DEMON_INTERVAL
+from engine import Board
+
+#Imports the autopilot, which can steer instead of the player
+from autopilot import Autopilot
+
+#Imports the replay recorder
+from replay import LatchedClock
+from replay import ReplayRecorder
+from replay import new_seed
+
+#Imports the required constants from scene
+from scene import POLL_RATE
+from scene import STING_POLL
+from scene import HUD_REFRESH
+from scene import BOARD_COLUMNS
+from scene import BOARD_ROWS
 
 def main():
     """ Driver program, used to run the snake game """
@@ -65,6 +80,8 @@ def main():
         #If the player hits ENTER, launch the game
         if user_input == INPUT.ENTER:
             play_demon_music = game(display, sound, controls)
+            if controls.quit:
+                return
             sound.play_menu_music(play_demon_music)
             controls.clear_menu_input()
             user_input = INPUT.SPACE
@@ -87,123 +104,164 @@ def main():
 def game(display, sound, controls):
     """ Used to run the actual game part of the program """
 
-    #Get the game rules
-    ruleset = GameRules()
-
-    #Create a new snake that will act as a queue, the head is location 0 and tail is location n.
-    snake = []
-    snake.append([GRID_SIZE_X/2 - GRID_SIZE_X/2 % CELL_SIZE,
-                  GRID_SIZE_Y/2 - GRID_SIZE_Y/2 % CELL_SIZE])
-
-    #Create a food handler
-    food = NonPlayerEntityHandler(snake)
-
-    #Set a INPUTection to start off with
+    #Create the game's state: rules, snake, food and demon. Time comes from pygame, and
+    #only changes when latched so the replay records the time each tick really saw
+    state = GameState(new_seed(), LatchedClock(pygame.time),
+                      board=Board(BOARD_COLUMNS, BOARD_ROWS))
+    recorder = ReplayRecorder(state)
+    display.set_board(state.board)
+    snake = state.snake
+    ruleset = state.ruleset
+    food = state.entities
+
+    #Set a INPUTection to start off with, turns from the last game are forgotten
     new_direction = INPUT.RIGHT
+    controls.reset_movement()
+    pilot = Autopilot(state)
 
     #Redraw the entire display
     display.redraw(snake, food.get_food_position(), food.get_demon_position(), ruleset.get_score())
 
 
     #Game's about to start, add the run info
-    run_stats = RunStats()
+    run_stats = RunStats(display.score_log)
+
+    #Paces the loop, sleeping between input polls instead of spinning a core
+    frame_clock = pygame.time.Clock()
+
+    #Time of the next logic tick, the demon keeps its own time in state.next_demon_time
+    next_tick_time = pygame.time.get_ticks() + tick_length(snake)
 
-    add_score_time = pygame.time.get_ticks()
+    #Times each stage of the loop, and when the HUD showing the timings next updates
+    frame_timer = FrameTimer()
+    next_hud_time = 0
 
     #While the player hasn't hit escape or lost
-    while(new_direction != INPUT.ESCAPE and
-          not ruleset.player_loss(snake, food.get_demon_position()) and
-          not ruleset.player_win(snake)):
-
-        #Wait as either a function of length of the snake or, if it's too small, 50 ms
-        wait_until = pygame.time.get_ticks() + max(UPPER_BOUND - len(snake)/2, LOWER_BOUND)
-        while (wait_until > pygame.time.get_ticks() and new_direction != INPUT.ESCAPE and
-               not ruleset.player_loss(snake, food.get_demon_position())):
-            #Update the audio player
-            sound.play_alive(snake)
-
-            #Get the snake's new direction
-            current_direction = controls.get_movement()
-            if current_direction != INPUT.NONE:
-                new_direction = current_direction
-
-            #Move the demon multiple times per round
-            if pygame.time.get_ticks() % 100 == 0:
-                food.set_demon_position(snake)
-                display.redraw(snake,
-                               food.get_food_position(),
-                               food.get_demon_position(),
-                               ruleset.get_score())
-
-        #If the demon hasn't caught the player
-        if not ruleset.player_loss(snake, food.get_demon_position()):
-            #Add score to the player every three seconds
-            if add_score_time <= pygame.time.get_ticks():
-                ruleset.add_to_score(5)
-                add_score_time += 3000
-
-            #Update the new head
-            snake.insert(0, movement_handler(new_direction, snake))
-
-            #Check if the player's eaten food
-            if ruleset.player_eats_food(snake, food.get_food_position()):
-                food.set_food_position(snake)
-                sound.play_food_collected(food.demon_active(snake))
-            #If the demon has spawned in, play it's sound
-            elif food.demon_active(snake):
-                sound.play_demon_move()
-
-            #If the snake isn't burning fat to grow, remove the old position of the tail
-            if not ruleset.player_burn_fat():
-                snake.pop()
+    while not state.over():
+        #Sleep until it's time to poll again
+        frame_clock.tick(POLL_RATE)
+        frame_timer.start_frame()
+        redraw_needed = False
+
+        #Update the audio player
+        sound.play_alive(snake)
+        frame_timer.mark('audio')
+
+        #Buffer any turns the player has pressed, so none are lost between ticks
+        if controls.poll_movement() == INPUT.ESCAPE:
+            new_direction = INPUT.ESCAPE
+        frame_timer.mark('input')
+
+        #Move the demon every 100 ms, catching up on any moves missed during a hitch so
+        #it moves at the same speed on every machine
+        while state.next_demon_time <= pygame.time.get_ticks() and not state.lost():
+            recorder.demon_moved(state.next_demon_time)
+            move_demons(state)
+            state.next_demon_time += DEMON_INTERVAL
+            redraw_needed = True
+        frame_timer.mark('demons')
+
+        #Wait as either a function of length of the snake or, if it's too small, 100 ms
+        if (next_tick_time <= pygame.time.get_ticks() or new_direction == INPUT.ESCAPE or
+                state.lost()):
+            #Take the next buffered turn, one per tick, unless the autopilot is steering
+            if new_direction != INPUT.ESCAPE:
+                new_direction = controls.get_movement(state.direction)
+                if controls.autopilot:
+                    new_direction = pilot.get_movement(state.direction)
+
+            #Score, move, eat and grow, unless the demon has caught the player
+            recorder.ticked(state.clock.latch(), new_direction)
+            moved = update(state, new_direction)
+            frame_timer.mark('rules')
+            if moved:
+                #Play the sound for eating food, or the demon's sound if it has spawned in
+                if state.ate_food:
+                    sound.play_food_collected(food.demon_active(snake))
+                elif food.demon_active(snake):
+                    sound.play_demon_move()
+                redraw_needed = True
+                frame_timer.mark('audio')
+
+            #Schedule from the last tick so the cadence doesn't drift, unless we fell behind
+            next_tick_time = max(next_tick_time + tick_length(snake),
+                                 pygame.time.get_ticks())
+
+        #Show the frame timings a few times a second if the player has turned them on
+        if not controls.show_hud:
+            display.set_hud(None)
+        elif next_hud_time <= pygame.time.get_ticks():
+            display.set_hud(frame_timer.hud_text())
+            next_hud_time = pygame.time.get_ticks() + HUD_REFRESH
+
+        if (redraw_needed or display.hud_changed) and not state.over():
+            display.redraw(snake,
+                           food.get_food_position(),
+                           food.get_demon_position(),
+                           ruleset.get_score())
+        frame_timer.mark('redraw')
+        frame_timer.end_frame(state.ticks)
 
     #Play the death music and possibly show an image
-    if(ruleset.player_loss(snake, food.get_demon_position())
+    if(state.lost()
        or new_direction == INPUT.ESCAPE and food.demon_active(snake)):
         if food.demon_active(snake):
             display.show_image()
         sound.play_dead(snake)
     #If the player somehow wins, play victory music
-    elif ruleset.player_win(snake):
+    elif state.won():
         sound.play_win()
 
-    #Output run to file
+    #Output run to file while the music plays, and keep the replay
     run_stats.output_to_file(ruleset.get_score())
+    run_stats.output_frame_times(frame_timer)
+    recorder.save(state)
+
+    #Wait for the music to end before stopping the game, sleeping until something happens
+    #so the window stays responsive
+    controls.quit = wait_for_sting(sound)
 
     return food.demon_active(snake)
 
-def movement_handler(new_direction, snake):
-    """ Handles movement for the snake """
-    #Get the head of the snake
-    new_head = snake[0].copy()
-    #Update the new head position based on where the snake moved
-    if new_direction == INPUT.LEFT:
-        new_head[0] -= CELL_SIZE
-    elif new_direction == INPUT.UP:
-        new_head[1] -= CELL_SIZE
-    elif new_direction == INPUT.RIGHT:
-        new_head[0] += CELL_SIZE
-    else: #new_direction == INPUT.DOWN:
-        new_head[1] += CELL_SIZE
-
-    #We will update the position of the snake's head
-    new_x, new_y = new_head
-    if len(snake) >= 2:
-        old_x, old_y = snake[1]
-    else:
-        old_x, old_y = [-1, -1]
-
-    #If the player is running into themselves, reverse their INPUTection
-    if new_x == old_x and new_y == old_y:
-        if new_direction == INPUT.LEFT:
-            new_head[0] += CELL_SIZE*2
-        elif new_direction == INPUT.UP:
-            new_head[1] += CELL_SIZE*2
-        elif new_direction == INPUT.RIGHT:
-            new_head[0] -= CELL_SIZE*2
-        else: #new_direction == INPUT.DOWN:
-            new_head[1] -= CELL_SIZE*2
-    return new_head
+def wait_for_sting(sound):
+    """ Handles events while the music ending a game plays. ESC cuts it short, and
+        closing the window stops it and returns True """
+    while sound.sting_playing():
+        event = pygame.event.wait(STING_POLL)
+        if event.type == pygame.QUIT:
+            sound.stop_sting()
+            return True
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            sound.stop_sting()
+            return False
+        sound.handle_event(event)
+    return False
+
+def watch_replay(replay):
+    """ Shows a recorded game in the window at the speed it was played, ESC stops it """
+    pygame.init()
+    display = DisplayUpdater()
+    display.generate_display()
+
+    state = replay.new_state()
+    display.set_board(state.board)
+    snake = state.snake
+    food = state.entities
+    display.redraw(snake, food.get_food_position(), food.get_demon_position(),
+                   state.ruleset.get_score())
+
+    start = pygame.time.get_ticks()
+    for ticks, changed in replay.playback(state):
+        #Wait until the event happened in the recorded game, stopping if ESC is hit
+        pygame.time.wait(max(0, start + ticks - pygame.time.get_ticks()))
+        if any(event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE
+               for event in pygame.event.get()):
+            break
+        if changed and not state.over():
+            display.redraw(snake, food.get_food_position(), food.get_demon_position(),
+                           state.ruleset.get_score())
+    return state
 
 #Call main
-main()
+if __name__ == "__main__":
+    main()